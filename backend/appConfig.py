@@ -0,0 +1,148 @@
+# appConfig.py
+
+import os
+
+# Tunables for the backend. Every value can be overridden with an environment
+# variable so deployments don't need code changes.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Secrets such as GOOGLE_API_KEY can also come from backend/.env when
+# python-dotenv is installed; variables already set in the environment win.
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    pass
+else:
+    load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+
+def _env_int(name: str, default: int) -> int:
+    """
+    Reads an integer from the environment, falling back to the default when
+    the variable is unset or malformed.
+    """
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"WARNING: Ignoring non-integer value for {name}: {value!r}")
+        return default
+
+
+# Number of processes used for CPU-heavy ingest stages (tree walking, file
+# reads, chunk parsing and FAISS index construction). 0 runs them on a thread.
+PROCESS_POOL_WORKERS = _env_int(
+    "REPOFLOW_PROCESS_WORKERS", max(1, min(4, (os.cpu_count() or 2) - 1))
+)
+
+# Number of uvicorn worker processes when the server is started with
+# `python main.py`. Workers share the persisted index read-only.
+WEB_WORKERS = _env_int("REPOFLOW_WEB_WORKERS", 1)
+HOST = os.environ.get("REPOFLOW_HOST", "127.0.0.1")
+PORT = _env_int("REPOFLOW_PORT", 8000)
+
+# Files used to coordinate ingest ownership and shared state between workers.
+INGEST_LOCK_FILE = os.path.join(BASE_DIR, "ingest.lock")
+REPO_STATE_FILE = os.path.join(BASE_DIR, "repo_state.json")
+# Every process publishes its model latency stats here (one file per pid),
+# so /api/provider-stats covers the ingest pool processes as well.
+PROVIDER_STATS_DIR = os.path.join(BASE_DIR, "provider_stats")
+
+# How smart_chunking asks the LLM for chunks: "span" returns line ranges that
+# are sliced from the file locally, "code" has the model echo every snippet.
+CHUNKING_MODE = os.environ.get("REPOFLOW_CHUNKING_MODE", "span").strip().lower()
+
+# In span mode, a chunk overlapping already-covered lines by more than this
+# fraction of its own length is dropped instead of trimmed.
+SPAN_MAX_OVERLAP = 0.5
+
+# Small files are packed together into one chunking request of up to this
+# many estimated tokens of file content (0 sends one request per file).
+# Files larger than CHUNK_BATCH_FILE_TOKENS are always chunked on their own.
+CHUNK_BATCH_TOKENS = _env_int("REPOFLOW_CHUNK_BATCH_TOKENS", 8000)
+CHUNK_BATCH_FILE_TOKENS = _env_int("REPOFLOW_CHUNK_BATCH_FILE_TOKENS", 2000)
+CHUNK_BATCH_MAX_FILES = _env_int("REPOFLOW_CHUNK_BATCH_MAX_FILES", 30)
+
+# Shared model-call gateway. Its limiter, breaker and lane state live in
+# MODEL_GATEWAY_STATE_FILE, so the limits apply to the web workers and ingest
+# pool processes together rather than to each process. Limits are starting
+# points: the request rate backs off when the provider throttles and
+# recovers on success.
+MODEL_GATEWAY_STATE_FILE = os.path.join(BASE_DIR, "model_gateway.json")
+MODEL_REQUESTS_PER_MINUTE = _env_int("REPOFLOW_MODEL_RPM", 60)
+MODEL_TOKENS_PER_MINUTE = _env_int("REPOFLOW_MODEL_TPM", 1_000_000)
+MODEL_MAX_RETRIES = _env_int("REPOFLOW_MODEL_MAX_RETRIES", 5)
+MODEL_BACKOFF_BASE_SECONDS = 1.0
+MODEL_BACKOFF_MAX_SECONDS = 60.0
+MODEL_BREAKER_FAILURES = _env_int("REPOFLOW_MODEL_BREAKER_FAILURES", 5)
+MODEL_BREAKER_RESET_SECONDS = 30.0
+
+# Model providers. "gemini" talks to Google's API; "offline" swaps in local
+# stand-ins (hashed embeddings, a mock LLM and a rule-based generative model) so the
+# backend can run without network access or an API key. The embedding
+# provider can also be "local": a CPU model loaded from LOCAL_EMBED_PATH.
+# The Gemini providers need GOOGLE_API_KEY; there is no built-in key.
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY", "").strip()
+EMBED_PROVIDER = os.environ.get("REPOFLOW_EMBED_PROVIDER", "gemini").strip().lower()
+LLM_PROVIDER = os.environ.get("REPOFLOW_LLM_PROVIDER", "gemini").strip().lower()
+STAGE_ONE_MODEL_NAME = os.environ.get("REPOFLOW_STAGE_ONE_MODEL", "gemini-2.5-flash")
+CHUNK_MODEL_NAME = os.environ.get("REPOFLOW_CHUNK_MODEL", "gemini-2.5-flash-lite")
+CHAT_MODEL_NAME = os.environ.get("REPOFLOW_CHAT_MODEL")
+
+# Embedding dimension. 0 uses the backend's native size (768 for Gemini and
+# the offline stand-in); a smaller value truncates local model vectors.
+EMBED_DIMENSION = _env_int("REPOFLOW_EMBED_DIMENSION", 0)
+LOCAL_EMBED_PATH = os.environ.get("REPOFLOW_LOCAL_EMBED_PATH", "")
+LOCAL_EMBED_BATCH_SIZE = _env_int("REPOFLOW_LOCAL_EMBED_BATCH_SIZE", 64)
+# Simulated per-call latency of the offline LLM and generative model, so
+# load tests see realistic model round-trips without a network.
+OFFLINE_MODEL_LATENCY_MS = _env_int("REPOFLOW_OFFLINE_LATENCY_MS", 0)
+
+# Cold-start budget checked by startupBenchmark.py: time from the start of
+# `import main` until the app has finished its startup hook.
+STARTUP_BUDGET_MS = _env_int("REPOFLOW_STARTUP_BUDGET_MS", 1500)
+
+# Each worker samples event-loop lag this often (0 disables the monitor);
+# a request blocking the loop shows up as lag in /api/loop-lag.
+LOOP_LAG_INTERVAL_MS = _env_int("REPOFLOW_LOOP_LAG_INTERVAL_MS", 100)
+
+# Two-stage retrieval: number of files picked by their summaries, then the
+# number of chunks returned from those files.
+RETRIEVAL_TOP_FILES = _env_int("REPOFLOW_RETRIEVAL_TOP_FILES", 3)
+RETRIEVAL_TOP_K = _env_int("REPOFLOW_RETRIEVAL_TOP_K", 3)
+
+# Chat queries executing at once per index version, and how many more may
+# wait; beyond that /api/chat answers 429 with the queue depth.
+CHAT_MAX_CONCURRENCY = _env_int("REPOFLOW_CHAT_CONCURRENCY", 8)
+CHAT_MAX_QUEUE = _env_int("REPOFLOW_CHAT_QUEUE", 32)
+
+# Deduplication before LLM chunking: exact content hashing plus MinHash
+# near-duplicate detection across files; chunks are only merged when their
+# text is identical. A threshold of 1.0 disables near-duplicate matching.
+DEDUP_ENABLED = _env_int("REPOFLOW_DEDUP", 1) == 1
+DEDUP_NEAR_THRESHOLD = 0.9
+
+# Persisted index versions, and where portable index bundles are exported to
+# and imported from. A bundle matching a workspace's repo commit, file set and
+# embedding model is imported instead of re-chunking and re-embedding.
+VECTOR_DB_DIR = os.path.join(BASE_DIR, "vector_db_chunks")
+INDEX_BUNDLE_DIR = os.environ.get("REPOFLOW_BUNDLE_DIR") or os.path.join(BASE_DIR, "index_bundles")
+
+# Speculative pre-indexing: once stage one has produced the workspaces, build
+# some of them in the background so selecting one only has to publish it.
+# Off by default because it spends model quota on workspaces that may never
+# be opened. Workspaces are built one at a time, "smallest" first or the
+# most "popular" (recently selected) first, up to a number of workspaces
+# and an estimated token budget per repository. Builds run in a process of
+# their own, never in the ingest pool, and pause while this worker is
+# ingesting or answering chat. Each build is paused or cancelled through its
+# own control file in PREINDEX_CONTROL_DIR.
+PREINDEX_ENABLED = _env_int("REPOFLOW_PREINDEX", 0) == 1
+PREINDEX_ORDER = os.environ.get("REPOFLOW_PREINDEX_ORDER", "smallest").strip().lower()
+PREINDEX_MAX_WORKSPACES = _env_int("REPOFLOW_PREINDEX_MAX_WORKSPACES", 3)
+PREINDEX_TOKEN_BUDGET = _env_int("REPOFLOW_PREINDEX_TOKEN_BUDGET", 500_000)
+PREINDEX_CONTROL_DIR = os.path.join(BASE_DIR, "preindex_control")
+WORKSPACE_POPULARITY_FILE = os.path.join(BASE_DIR, "workspace_popularity.json")
@@ -0,0 +1,113 @@
+# chatAdmission.py
+
+import asyncio
+import math
+import time
+
+from appConfig import CHAT_MAX_CONCURRENCY, CHAT_MAX_QUEUE
+
+
+class ChatQueueFullError(Exception):
+    """Raised when an index already has as many chat queries as it may queue."""
+
+    def __init__(self, queue_depth: int, retry_after: int):
+        super().__init__(f"Chat queue is full ({queue_depth} waiting)")
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+
+
+class ChatAdmission:
+    """
+    Admission control for the chat queries of one index version.
+
+    At most `max_concurrency` queries execute at once; up to `max_queue`
+    more wait their turn, and anything beyond that is refused with
+    ChatQueueFullError so clients back off instead of piling up. A query
+    identical to one already queued or running is not executed again: it
+    waits for the running one and gets the same answer.
+
+    Used from the event loop only, so the counters need no lock.
+    """
+
+    def __init__(self, max_concurrency: int = CHAT_MAX_CONCURRENCY, max_queue: int = CHAT_MAX_QUEUE):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._inflight = {}
+        self._running = 0
+        self._waiting = 0
+        # Smoothed execution time, used to suggest when to retry
+        self._mean_seconds = 1.0
+        self.completed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Queries waiting for an execution slot."""
+        return max(0, self._running + self._waiting - self.max_concurrency)
+
+    async def run(self, key, factory):
+        """
+        Runs `factory()`, a coroutine function, as the execution for `key`,
+        or joins the execution already in flight for the same key.
+
+        Raises:
+            ChatQueueFullError: If the query would have to queue and the
+                                queue is full.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        if self._running + self._waiting >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise ChatQueueFullError(self.queue_depth, self._retry_after())
+
+        # Counted as waiting now, not when the task first runs, so requests
+        # arriving in the same loop iteration see each other.
+        self._waiting += 1
+        task = asyncio.ensure_future(self._execute(factory))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        # Shielded so one client disconnecting doesn't cancel the execution
+        # other requests are waiting on
+        return await asyncio.shield(task)
+
+    async def _execute(self, factory):
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._running += 1
+        start = time.monotonic()
+        try:
+            return await factory()
+        finally:
+            self._running -= 1
+            self._semaphore.release()
+            self.completed += 1
+            self._mean_seconds = 0.8 * self._mean_seconds + 0.2 * (time.monotonic() - start)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Every waiter re-raises the error; this only marks it retrieved
+            task.exception()
+
+    def _retry_after(self) -> int:
+        # Roughly how long until the current queue has drained
+        return max(1, math.ceil(self._mean_seconds * (self.queue_depth + 1) / self.max_concurrency))
+
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "queue_depth": self.queue_depth,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+        }
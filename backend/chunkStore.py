@@ -0,0 +1,242 @@
+# chunkStore.py
+
+import json
+import sqlite3
+import sys
+import threading
+
+CHUNK_STORE_NAME = "chunks.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,             -- also the chunk's FAISS id
+    node_id TEXT NOT NULL UNIQUE,
+    ref_doc_id TEXT,
+    file TEXT NOT NULL,
+    name TEXT,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL              -- JSON
+);
+-- Every file a chunk belongs to: its own file plus deduplicated copies.
+CREATE TABLE IF NOT EXISTS chunk_files (
+    file TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL REFERENCES chunks(id) ON DELETE CASCADE,
+    PRIMARY KEY (file, chunk_id)
+) WITHOUT ROWID;
+-- Content hash of every indexed file, so a later build only re-chunks the
+-- files that changed.
+CREATE TABLE IF NOT EXISTS files (
+    file TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_chunks_file ON chunks(file);
+CREATE INDEX IF NOT EXISTS idx_chunks_name ON chunks(name);
+CREATE INDEX IF NOT EXISTS idx_chunk_files_chunk ON chunk_files(chunk_id);
+"""
+
+
+def _prefix_upper_bound(prefix: str) -> str | None:
+    """
+    The smallest string greater than every string starting with `prefix`,
+    or None if there is none.
+    """
+    while prefix and ord(prefix[-1]) == sys.maxunicode:
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def copy_chunk_store(source: str, target: str):
+    """
+    Copies a chunk store to `target`. The SQLite backup API gives a
+    consistent copy even while readers have the store open.
+    """
+    src = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+class ChunkStore:
+    """
+    SQLite-backed document and metadata store for indexed chunks.
+
+    Chunk rows are keyed by the same integer id used in the FAISS index, so a
+    vector hit maps straight to its row. File and symbol name are indexed
+    columns, which lets the retriever filter by metadata without scanning
+    every chunk. Inserts and deletes are per file and transactional, so an
+    incremental build replaces just the changed files' rows, and its FAISS
+    index removes and adds just their vectors under the same ids.
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            # WAL lets other workers keep reading while a writer commits.
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add_nodes(self, nodes: list, file_hashes: dict[str, str] | None = None) -> list[int]:
+        """
+        Inserts LlamaIndex nodes in one transaction, recording the content
+        hashes of the files they were chunked from.
+
+        Returns:
+            The integer ids assigned to the nodes, in order, to be used as
+            their FAISS ids.
+        """
+        ids = []
+        with self._lock, self._conn:
+            for node in nodes:
+                metadata = dict(node.metadata)
+                file_path = metadata.get("file", "")
+                cursor = self._conn.execute(
+                    "INSERT INTO chunks (node_id, ref_doc_id, file, name, text, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                    (node.node_id, node.ref_doc_id, file_path, metadata.get("name"),
+                     node.get_content(), json.dumps(metadata))
+                )
+                chunk_id = cursor.lastrowid
+                owners = {file_path, *(metadata.get("duplicate_files") or [])}
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO chunk_files (file, chunk_id) VALUES (?, ?)",
+                    [(owner, chunk_id) for owner in owners if owner]
+                )
+                ids.append(chunk_id)
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (file, sha256) VALUES (?, ?)",
+                list((file_hashes or {}).items())
+            )
+        return ids
+
+    def delete_files(self, files) -> tuple[list[int], set[str]]:
+        """
+        Deletes the chunks of the given files in one transaction. A chunk
+        shared through deduplication goes with any of its files, so the other
+        files sharing it lose it too; their remaining chunks are deleted as
+        well, and they have to be chunked again.
+
+        Returns:
+            The ids of the deleted chunks, for removal from the FAISS index,
+            and every file whose chunks were deleted.
+        """
+        pending = set(files)
+        deleted_files = set()
+        ids = set()
+        with self._lock, self._conn:
+            while pending:
+                deleted_files |= pending
+                batch = list(pending)
+                placeholders = ",".join("?" * len(batch))
+                new_ids = {
+                    row[0] for row in self._conn.execute(
+                        f"SELECT chunk_id FROM chunk_files WHERE file IN ({placeholders})", batch
+                    )
+                } - ids
+                ids |= new_ids
+                pending = set()
+                if new_ids:
+                    id_placeholders = ",".join("?" * len(new_ids))
+                    pending = {
+                        row[0] for row in self._conn.execute(
+                            f"SELECT DISTINCT file FROM chunk_files WHERE chunk_id IN ({id_placeholders})",
+                            list(new_ids)
+                        )
+                    } - deleted_files
+            deleted = sorted(ids)
+            if deleted:
+                # chunk_files rows go with their chunks (ON DELETE CASCADE)
+                self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in deleted])
+            self._conn.executemany("DELETE FROM files WHERE file = ?", [(f,) for f in deleted_files])
+        return deleted, deleted_files
+
+    def file_hashes(self) -> dict[str, str]:
+        """Content hash of every file recorded by add_nodes."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT file, sha256 FROM files"))
+
+    def indexed_files(self) -> set[str]:
+        """Every file that has chunks, including deduplicated copies."""
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT DISTINCT file FROM chunk_files")}
+
+    def get_nodes(self, ids: list[int]) -> list:
+        """
+        Returns TextNodes for the given ids, in the same order.
+        """
+        from llama_index.core.schema import TextNode, NodeRelationship, RelatedNodeInfo
+
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, node_id, ref_doc_id, text, metadata FROM chunks WHERE id IN ({placeholders})",
+                [int(i) for i in ids]
+            ).fetchall()
+        by_id = {}
+        for chunk_id, node_id, ref_doc_id, text, metadata in rows:
+            node = TextNode(id_=node_id, text=text, metadata=json.loads(metadata))
+            if ref_doc_id:
+                node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=ref_doc_id)
+            by_id[chunk_id] = node
+        return [by_id[int(i)] for i in ids if int(i) in by_id]
+
+    def filter_ids(self, path_prefix: str | None = None, files: list[str] | None = None,
+                   name: str | None = None) -> list[int]:
+        """
+        Returns ids of chunks matching every given metadata filter. Files
+        match through chunk_files, so deduplicated copies are included.
+        """
+        clauses = []
+        params = []
+        if path_prefix:
+            # A range on the (file, chunk_id) primary key rather than LIKE,
+            # which is case-insensitive and can't use the index
+            upper = _prefix_upper_bound(path_prefix)
+            if upper is None:
+                clauses.append("id IN (SELECT chunk_id FROM chunk_files WHERE file >= ?)")
+                params.append(path_prefix)
+            else:
+                clauses.append("id IN (SELECT chunk_id FROM chunk_files WHERE file >= ? AND file < ?)")
+                params.extend([path_prefix, upper])
+        if files:
+            clauses.append(f"id IN (SELECT chunk_id FROM chunk_files WHERE file IN ({','.join('?' * len(files))}))")
+            params.extend(files)
+        if name:
+            clauses.append("name = ?")
+            params.append(name)
+        where = " AND ".join(clauses) if clauses else "1"
+        with self._lock:
+            return [row[0] for row in self._conn.execute(f"SELECT id FROM chunks WHERE {where} ORDER BY id", params)]
+
+    def file_chunks(self) -> dict[str, list[dict]]:
+        """
+        Maps every file to its chunks (id and metadata), including chunks it
+        shares through deduplication.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT cf.file, c.id, c.metadata FROM chunk_files cf JOIN chunks c ON c.id = cf.chunk_id "
+                "ORDER BY cf.file, c.id"
+            ).fetchall()
+        files = {}
+        for file_path, chunk_id, metadata in rows:
+            files.setdefault(file_path, []).append({"id": chunk_id, "metadata": json.loads(metadata)})
+        return files
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
@@ -0,0 +1,134 @@
+# dedup.py
+
+import hashlib
+import re
+
+import numpy as np
+
+from appConfig import DEDUP_NEAR_THRESHOLD
+
+# MinHash parameters: 64 permutations split into 16 LSH bands of 4 rows.
+# Pairs at Jaccard 0.9 share a band with probability ~1.0, pairs at 0.5
+# with probability ~0.64, and every candidate is verified afterwards.
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+SHINGLE_SIZE = 5
+# Texts with fewer shingles than this are only deduplicated exactly; near-
+# duplicate estimates on a handful of tokens are mostly noise.
+MIN_SHINGLES = 20
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240917)
+_PERM_A = _rng.integers(1, _MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.int64)
+_PERM_B = _rng.integers(0, _MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.int64)
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def normalize(text: str) -> str:
+    """
+    Normalizes line endings and trailing whitespace so trivially different
+    copies hash the same.
+    """
+    lines = [line.rstrip() for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
+    return "\n".join(lines).strip("\n")
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 of the normalized text."""
+    return hashlib.sha256(normalize(text).encode("utf-8")).hexdigest()
+
+
+def _shingles(text: str) -> np.ndarray:
+    tokens = _TOKEN_PATTERN.findall(text)
+    if len(tokens) < SHINGLE_SIZE:
+        return np.empty(0, dtype=np.int64)
+    hashes = {
+        int.from_bytes(
+            hashlib.blake2b(" ".join(tokens[i:i + SHINGLE_SIZE]).encode("utf-8"), digest_size=8).digest(),
+            "little"
+        ) % _MERSENNE_PRIME
+        for i in range(len(tokens) - SHINGLE_SIZE + 1)
+    }
+    return np.fromiter(hashes, dtype=np.int64, count=len(hashes))
+
+
+def minhash_signature(text: str) -> np.ndarray | None:
+    """
+    MinHash signature of the text's token shingles, or None if the text is
+    too short to compare meaningfully.
+    """
+    shingles = _shingles(text)
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    # (a*x + b) mod p for every permutation and shingle at once; a and x
+    # are below 2**31 so the products fit in int64.
+    permuted = (np.outer(_PERM_A, shingles) + _PERM_B[:, None]) % _MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+
+def estimated_jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+
+def group_duplicates(items: dict[str, str], threshold: float = DEDUP_NEAR_THRESHOLD) -> dict[str, list[str]]:
+    """
+    Groups exact and near-duplicate texts.
+
+    Args:
+        items: Mapping of key (e.g. file path) to text, in priority order; the
+               first key of each group becomes its representative.
+        threshold: Minimum estimated Jaccard similarity for near-duplicates.
+
+    Returns:
+        Mapping of representative key to the keys it stands in for (empty
+        list when unique). Every input key appears exactly once.
+    """
+    groups = {}
+    by_hash = {}
+    for key, text in items.items():
+        digest = content_hash(text)
+        if digest in by_hash:
+            groups[by_hash[digest]].append(key)
+        else:
+            by_hash[digest] = key
+            groups[key] = []
+
+    if threshold >= 1.0:
+        return groups
+
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    buckets = {}
+    signatures = {}
+    merged = {}
+    for key in list(groups):
+        signature = minhash_signature(items[key])
+        if signature is None:
+            continue
+
+        candidates = []
+        band_keys = []
+        for band in range(LSH_BANDS):
+            band_key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            band_keys.append(band_key)
+            for other in buckets.get(band_key, ()):
+                if other not in candidates:
+                    candidates.append(other)
+
+        match = next(
+            (other for other in candidates
+             if estimated_jaccard(signature, signatures[other]) >= threshold),
+            None
+        )
+        if match is not None:
+            merged[key] = match
+            continue
+
+        signatures[key] = signature
+        for band_key in band_keys:
+            buckets.setdefault(band_key, []).append(key)
+
+    for key, representative in merged.items():
+        groups[representative].append(key)
+        groups[representative].extend(groups.pop(key))
+    return groups
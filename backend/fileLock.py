@@ -0,0 +1,96 @@
+# fileLock.py
+
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Inter-process lock backed by a local lock file.
+
+    Used to make sure only one uvicorn worker owns an ingest at a time. The
+    lock is released automatically by the OS if the owning process dies.
+
+    With shared=True any number of holders can take it at once, while an
+    exclusive try_acquire on the same file fails until they have all
+    released it. Windows has no shared locks, so there a shared acquire
+    always succeeds without locking.
+    """
+
+    def __init__(self, path: str, shared: bool = False):
+        self.path = path
+        self.shared = shared
+        self._fd = None
+
+    @property
+    def is_held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """
+        Attempts to take the lock without waiting.
+
+        Returns:
+            True if the lock was taken, False if another process (or another
+            operation in this process) already owns it.
+        """
+        if self._fd is not None:
+            return False
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            elif not self.shared:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+
+        if self.shared:
+            self._fd = fd
+            return True
+
+        # Record the owner to make stuck locks easy to diagnose.
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def acquire(self):
+        """
+        Takes the lock, waiting for other holders to release it. Meant for
+        short critical sections; ingest ownership uses try_acquire.
+        """
+        if self._fd is not None:
+            raise RuntimeError(f"Lock {self.path} is already held by this process")
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+            elif not self.shared:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self):
+        """Releases the lock if this process holds it."""
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            elif not self.shared:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
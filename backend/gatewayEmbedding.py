@@ -0,0 +1,119 @@
+# gatewayEmbedding.py
+
+import time
+from contextlib import nullcontext
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+from modelGateway import get_gateway, estimate_tokens, INTERACTIVE, BACKGROUND
+from tokenLedger import record_usage
+
+
+class GatewayEmbedding(BaseEmbedding):
+    """
+    Wraps a LlamaIndex embedding model so every embedding request goes
+    through the shared model gateway. Query embeddings run in the
+    interactive lane, document embeddings in the background lane.
+
+    Local models pass rate_limited=False: their calls are only timed, since
+    quotas and retries don't apply to them. Every call is recorded in the
+    token ledger; document embeddings count towards the "embedding" stage,
+    query embeddings towards whatever stage issued the query.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _stats = PrivateAttr(default=None)
+    _rate_limited: bool = PrivateAttr(default=True)
+
+    def __init__(self, inner: BaseEmbedding, stats=None, rate_limited: bool = True, **kwargs):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs
+        )
+        self._inner = inner
+        self._stats = stats
+        self._rate_limited = rate_limited
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        """The wrapped embedding model."""
+        return self._inner
+
+    def _call(self, func, arg, priority, tokens, label):
+        func = self._timed(func)
+        start = time.perf_counter()
+        if not self._rate_limited:
+            result = func(arg)
+        else:
+            result = get_gateway().call(func, arg, priority=priority, tokens=tokens, label=label)
+        self._record(label, priority, tokens, start)
+        return result
+
+    async def _acall(self, func, arg, priority, tokens, label):
+        func = self._atimed(func)
+        start = time.perf_counter()
+        if not self._rate_limited:
+            result = await func(arg)
+        else:
+            result = await get_gateway().acall(func, arg, priority=priority, tokens=tokens, label=label)
+        self._record(label, priority, tokens, start)
+        return result
+
+    def _record(self, label, priority, tokens, start):
+        record_usage(
+            label, self.model_name, tokens, 0, True, time.perf_counter() - start,
+            stage="embedding" if priority == BACKGROUND else None
+        )
+
+    def _track(self):
+        return self._stats.track() if self._stats is not None else nullcontext()
+
+    def _timed(self, func):
+        def wrapper(*args):
+            with self._track():
+                return func(*args)
+        return wrapper
+
+    def _atimed(self, func):
+        async def wrapper(*args):
+            with self._track():
+                return await func(*args)
+        return wrapper
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "GatewayEmbedding"
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._call(
+            self._inner.get_query_embedding, query,
+            INTERACTIVE, estimate_tokens(query), "query embedding"
+        )
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._call(
+            self._inner.get_text_embedding, text,
+            BACKGROUND, estimate_tokens(text), "text embedding"
+        )
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        # BaseEmbedding already splits into embed_batch_size batches, so each
+        # call here is one provider request.
+        return self._call(
+            self._inner._get_text_embeddings, texts,
+            BACKGROUND, sum(estimate_tokens(t) for t in texts), "batch embedding"
+        )
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return await self._acall(
+            self._inner.aget_query_embedding, query,
+            INTERACTIVE, estimate_tokens(query), "query embedding"
+        )
+
+    async def _aget_text_embedding(self, text: str) -> list[float]:
+        return await self._acall(
+            self._inner.aget_text_embedding, text,
+            BACKGROUND, estimate_tokens(text), "text embedding"
+        )
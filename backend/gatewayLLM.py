@@ -0,0 +1,136 @@
+# gatewayLLM.py
+
+import time
+from contextlib import nullcontext
+
+from llama_index.core.base.llms.types import LLMMetadata
+from llama_index.core.llms.llm import LLM
+from pydantic import PrivateAttr
+
+from modelGateway import get_gateway, estimate_tokens, INTERACTIVE
+from tokenLedger import record_response
+
+
+class GatewayLLM(LLM):
+    """
+    Wraps a LlamaIndex LLM so every request goes through the shared model
+    gateway in the interactive lane. Only the model call itself is gated:
+    a chat query takes one gateway slot for its query embedding and one per
+    synthesis request, and a retry repeats just the request that failed.
+
+    Each completed request is recorded to the current token ledger with the
+    provider's reported usage when the response carries it.
+
+    Local stand-ins pass rate_limited=False: their calls are only timed.
+    Streaming calls are admitted by the gateway but not retried, since a
+    stream can't be replayed once the caller has consumed part of it.
+    """
+
+    _inner: LLM = PrivateAttr()
+    _stats = PrivateAttr(default=None)
+    _rate_limited: bool = PrivateAttr(default=True)
+
+    def __init__(self, inner: LLM, stats=None, rate_limited: bool = True, **kwargs):
+        super().__init__(callback_manager=inner.callback_manager, **kwargs)
+        self._inner = inner
+        self._stats = stats
+        self._rate_limited = rate_limited
+
+    @property
+    def inner(self) -> LLM:
+        """The wrapped LLM."""
+        return self._inner
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "GatewayLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return self._inner.metadata
+
+    def _track(self):
+        return self._stats.track() if self._stats is not None else nullcontext()
+
+    def _record(self, label, arg, response, start):
+        record_response(label, self.metadata.model_name, _prompt_text(arg), response, time.perf_counter() - start)
+
+    def _call(self, func, arg, label, **kwargs):
+        def timed(*args, **kw):
+            start = time.perf_counter()
+            with self._track():
+                response = func(*args, **kw)
+            self._record(label, arg, response, start)
+            return response
+
+        if not self._rate_limited:
+            return timed(arg, **kwargs)
+        return get_gateway().call(timed, arg, priority=INTERACTIVE, tokens=_tokens(arg), label=label, **kwargs)
+
+    async def _acall(self, func, arg, label, **kwargs):
+        async def timed(*args, **kw):
+            start = time.perf_counter()
+            with self._track():
+                response = await func(*args, **kw)
+            self._record(label, arg, response, start)
+            return response
+
+        if not self._rate_limited:
+            return await timed(arg, **kwargs)
+        return await get_gateway().acall(timed, arg, priority=INTERACTIVE, tokens=_tokens(arg), label=label,
+                                         **kwargs)
+
+    def _admit(self, arg):
+        # Streams only wait for capacity; see the class docstring
+        if self._rate_limited:
+            get_gateway().call(lambda: None, priority=INTERACTIVE, tokens=_tokens(arg), label="llm stream")
+
+    async def _aadmit(self, arg):
+        if self._rate_limited:
+            await get_gateway().acall(_noop, priority=INTERACTIVE, tokens=_tokens(arg), label="llm stream")
+
+    def chat(self, messages, **kwargs):
+        return self._call(self._inner.chat, messages, "llm chat", **kwargs)
+
+    def complete(self, prompt, formatted: bool = False, **kwargs):
+        return self._call(self._inner.complete, prompt, "llm completion", formatted=formatted, **kwargs)
+
+    async def achat(self, messages, **kwargs):
+        return await self._acall(self._inner.achat, messages, "llm chat", **kwargs)
+
+    async def acomplete(self, prompt, formatted: bool = False, **kwargs):
+        return await self._acall(self._inner.acomplete, prompt, "llm completion", formatted=formatted, **kwargs)
+
+    def stream_chat(self, messages, **kwargs):
+        self._admit(messages)
+        return self._inner.stream_chat(messages, **kwargs)
+
+    def stream_complete(self, prompt, formatted: bool = False, **kwargs):
+        self._admit(prompt)
+        return self._inner.stream_complete(prompt, formatted=formatted, **kwargs)
+
+    async def astream_chat(self, messages, **kwargs):
+        await self._aadmit(messages)
+        return await self._inner.astream_chat(messages, **kwargs)
+
+    async def astream_complete(self, prompt, formatted: bool = False, **kwargs):
+        await self._aadmit(prompt)
+        return await self._inner.astream_complete(prompt, formatted=formatted, **kwargs)
+
+
+def _prompt_text(arg) -> str:
+    """The text of a prompt string or a list of chat messages."""
+    if isinstance(arg, str):
+        return arg
+    return "\n".join(str(getattr(message, "content", "") or "") for message in arg)
+
+
+def _tokens(arg) -> int:
+    """Estimated prompt tokens of a prompt string or a list of chat messages."""
+    if isinstance(arg, str):
+        return estimate_tokens(arg)
+    return sum(estimate_tokens(str(getattr(message, "content", "") or "")) for message in arg)
+
+
+async def _noop():
+    return None
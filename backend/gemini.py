@@ -2,18 +2,11 @@
 
 import os
 import json
-import google.generativeai as genai
-
-# Configure the Gemini API key.
-try:
-    genai.configure(api_key="GOOGLE_API_KEY")
-except KeyError:
-    print("FATAL ERROR: 'GOOGLE_API_KEY' environment variable not set.")
-    print("Please set it before running the script.")
-    pass
-
-# Initialize the Gemini model globally
-model = genai.GenerativeModel('gemini-2.5-flash')
+import time
+from appConfig import STAGE_ONE_MODEL_NAME
+from modelGateway import get_gateway, estimate_tokens, BACKGROUND
+from providers import get_registry
+from tokenLedger import usage_context, record_response, STAGE_ONE_LEDGER_FILE
 
 # Define the prompt as a constant within this file.
 STAGE1_PROMPT = """
@@ -55,7 +48,7 @@ Only return valid JSON. No markdown, no prose, no commentary — just the array.
 """
 
 
-def stageOne(treeStructurePath: str, workspaceFilePath: str) -> str:
+def stageOne(treeStructurePath: str, workspaceFilePath: str, repo: str | None = None) -> str:
     """
     Generates content using an LLM by combining a prompt with the content of a
     tree structure/README file and stores the response as a JSON file.
@@ -64,6 +57,7 @@ def stageOne(treeStructurePath: str, workspaceFilePath: str) -> str:
         treeStructurePath: The path to the file containing the
                            combined tree structure and README text.
         workspaceFilePath: The path where the output JSON file will be saved.
+        repo: Repository the call's token usage is attributed to.
 
     Returns:
         A success message indicating the response has been saved.
@@ -97,11 +91,21 @@ def stageOne(treeStructurePath: str, workspaceFilePath: str) -> str:
         {separator}
     """
     try:
-        # Request a structured JSON response from the model
-        response = model.generate_content(
-            llm1_input.strip(),
-            generation_config={"response_mime_type": "application/json"}
-        )
+        # Request a structured JSON response from the model, through the
+        # shared gateway so quota errors are retried with backoff
+        model = get_registry().generative_model(STAGE_ONE_MODEL_NAME)
+        with usage_context(ledger=STAGE_ONE_LEDGER_FILE, stage="stage_one", repo=repo):
+            start = time.perf_counter()
+            response = get_gateway().call(
+                model.generate_content,
+                llm1_input.strip(),
+                generation_config={"response_mime_type": "application/json"},
+                priority=BACKGROUND,
+                tokens=estimate_tokens(llm1_input),
+                label="stage one"
+            )
+            record_response("stage one", STAGE_ONE_MODEL_NAME, llm1_input.strip(), response,
+                            time.perf_counter() - start)
         
         # Extract the JSON text from the response
         json_output = response.text
@@ -0,0 +1,210 @@
+# hierarchicalRetriever.py
+
+import asyncio
+import json
+import os
+
+import faiss
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+FILE_INDEX_NAME = "file_index.bin"
+FILE_SUMMARIES_NAME = "file_summaries.json"
+
+
+def _file_summary(file_path: str, chunks: list[dict]) -> str:
+    """
+    Builds the text embedded for a file from its chunks' names,
+    descriptions and keywords.
+    """
+    lines = [f"File: {file_path}"]
+    keywords = []
+    for chunk in chunks:
+        name = chunk.get("name") or "misc"
+        description = chunk.get("description") or ""
+        if name != "misc" or description:
+            lines.append(f"- {name}: {description}".rstrip(": "))
+        for keyword in chunk.get("keywords") or []:
+            if keyword not in keywords:
+                keywords.append(keyword)
+    if keywords:
+        lines.append("Keywords: " + ", ".join(str(k) for k in keywords))
+    return "\n".join(lines)
+
+
+def _previous_summary_vectors(previous_dir: str | None) -> dict[str, np.ndarray]:
+    """Summary vectors of an earlier version's file index, keyed by summary text."""
+    if previous_dir is None:
+        return {}
+    try:
+        file_index, entries = load_file_index(previous_dir)
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"  Could not reuse the previous file-level index: {e}")
+        return {}
+    if file_index is None or file_index.ntotal != len(entries):
+        return {}
+    return {entry["summary"]: file_index.reconstruct(i) for i, entry in enumerate(entries)}
+
+
+def build_file_index(chunk_store, embed_model, vector_db_dir: str, dimension: int,
+                     previous_dir: str | None = None):
+    """
+    Builds the file-level index that sits above the chunk index: one summary
+    vector per file, plus the ids of the chunks belonging to each file.
+
+    Args:
+        chunk_store: The ChunkStore holding the chunks that were just indexed.
+        embed_model: The embedding model used for the chunks.
+        vector_db_dir: Directory the index is persisted to.
+        dimension: Embedding dimension.
+        previous_dir: Version an incremental build started from. Files whose
+                      summary hasn't changed reuse its vectors.
+    """
+    files = chunk_store.file_chunks()
+    if not files:
+        return
+
+    entries = []
+    for file_path, chunks in files.items():
+        # Nodes split from the same chunk share its metadata; summarise it once.
+        unique = {}
+        for chunk in chunks:
+            unique.setdefault(json.dumps(chunk["metadata"], sort_keys=True), chunk["metadata"])
+        entries.append({
+            "file": file_path,
+            "summary": _file_summary(file_path, list(unique.values())),
+            "chunk_ids": [chunk["id"] for chunk in chunks],
+        })
+
+    vectors = _previous_summary_vectors(previous_dir)
+    changed = [e["summary"] for e in entries if e["summary"] not in vectors]
+    if changed:
+        vectors.update(zip(changed, np.array(embed_model.get_text_embedding_batch(changed), dtype="float32")))
+    file_index = faiss.IndexFlatL2(dimension)
+    file_index.add(np.array([vectors[e["summary"]] for e in entries], dtype="float32"))
+
+    faiss.write_index(file_index, os.path.join(vector_db_dir, FILE_INDEX_NAME))
+    with open(os.path.join(vector_db_dir, FILE_SUMMARIES_NAME), "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=2)
+    print(f"  File-level index saved with {len(entries)} file summaries ({len(changed)} embedded)")
+
+
+def load_file_index(vector_db_dir: str):
+    """
+    Loads the file-level index, or returns (None, None) if the index was
+    built without one.
+    """
+    index_path = os.path.join(vector_db_dir, FILE_INDEX_NAME)
+    summaries_path = os.path.join(vector_db_dir, FILE_SUMMARIES_NAME)
+    if not (os.path.exists(index_path) and os.path.exists(summaries_path)):
+        return None, None
+    with open(summaries_path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    return faiss.read_index(index_path), entries
+
+
+class HierarchicalRetriever(BaseRetriever):
+    """
+    Two-stage retriever: first picks the files whose summaries best match
+    the query, then searches only those files' chunks. Search cost grows
+    with the chunks of the selected files instead of the whole index.
+
+    Metadata filters (path_prefix, files, name) are resolved against the
+    chunk store's indexed columns before any vector is compared. Without a
+    file-level index it searches all (filtered) chunks directly.
+    """
+
+    def __init__(self, chunk_store, chunk_faiss_index, file_index, file_entries, embed_model,
+                 top_files: int = 3, top_k: int = 3, filters: dict | None = None, **kwargs):
+        super().__init__(**kwargs)
+        self._chunk_store = chunk_store
+        self._chunk_faiss_index = chunk_faiss_index
+        self._file_index = file_index
+        self._file_entries = file_entries
+        self._embed_model = embed_model
+        self._top_files = top_files
+        self._top_k = top_k
+        self._filters = {key: value for key, value in (filters or {}).items() if value}
+
+    def with_filters(self, **filters) -> "HierarchicalRetriever":
+        """Returns a retriever over the same indexes restricted by metadata filters."""
+        return HierarchicalRetriever(
+            self._chunk_store, self._chunk_faiss_index, self._file_index, self._file_entries,
+            self._embed_model, top_files=self._top_files, top_k=self._top_k,
+            filters={**self._filters, **filters}
+        )
+
+    def _query_vector(self, query_bundle: QueryBundle) -> np.ndarray:
+        embedding = query_bundle.embedding
+        if embedding is None:
+            embedding = self._embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+        return np.array([embedding], dtype="float32")
+
+    def _select_chunk_ids(self, query_vector: np.ndarray, allowed: set | None) -> np.ndarray | None:
+        """
+        Returns the candidate chunk ids for the query, or None to search
+        every chunk. If the file stage selects nothing, the candidates are
+        all (filtered) chunks, as without a file-level index.
+        """
+        flat = None if allowed is None else np.array(sorted(allowed), dtype="int64")
+        if self._file_index is None:
+            return flat
+
+        # With a filter, rank every file so filtered-out ones can be skipped.
+        k = len(self._file_entries) if allowed is not None else min(self._top_files, len(self._file_entries))
+        k = min(k, self._file_index.ntotal)
+        if k <= 0 or self._top_files <= 0:
+            return flat
+        _, hits = self._file_index.search(query_vector, k)
+        chunk_ids = set()
+        picked = 0
+        for hit in hits[0]:
+            if hit < 0 or picked >= self._top_files:
+                continue
+            ids = set(self._file_entries[hit]["chunk_ids"])
+            if allowed is not None:
+                ids &= allowed
+            if ids:
+                chunk_ids.update(ids)
+                picked += 1
+        if not chunk_ids:
+            return flat
+        return np.array(sorted(chunk_ids), dtype="int64")
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        if self._top_k <= 0:
+            return []
+        query_vector = self._query_vector(query_bundle)
+        allowed = set(self._chunk_store.filter_ids(**self._filters)) if self._filters else None
+        chunk_ids = self._select_chunk_ids(query_vector, allowed)
+
+        if chunk_ids is None:
+            k = min(self._top_k, self._chunk_faiss_index.ntotal)
+            if k == 0:
+                return []
+            distances, ids = self._chunk_faiss_index.search(query_vector, k)
+            hits = [(int(i), float(d)) for i, d in zip(ids[0], distances[0]) if i >= 0]
+        elif len(chunk_ids) == 0:
+            # Nothing matches the filters
+            return []
+        else:
+            vectors = self._chunk_faiss_index.reconstruct_batch(chunk_ids)
+            # Squared L2 distance, the same score the FAISS search reports.
+            distances = ((vectors - query_vector) ** 2).sum(axis=1)
+            best = np.argsort(distances)[:self._top_k]
+            hits = [(int(chunk_ids[i]), float(distances[i])) for i in best]
+
+        nodes = self._chunk_store.get_nodes([chunk_id for chunk_id, _ in hits])
+        return [
+            NodeWithScore(node=node, score=score)
+            for node, (_, score) in zip(nodes, hits)
+        ]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = await self._embed_model.aget_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        # The FAISS search and SQLite reads block, so they run off the event loop
+        return await asyncio.to_thread(self._retrieve, query_bundle)
@@ -0,0 +1,377 @@
+# indexBundle.py
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+from appConfig import (
+    BASE_DIR, VECTOR_DB_DIR, INDEX_BUNDLE_DIR, CHUNKING_MODE, CHUNK_MODEL_NAME,
+    STAGE_ONE_MODEL_NAME, DEDUP_ENABLED
+)
+from chunkStore import copy_chunk_store
+from fileLock import FileLock
+from indexVersions import (
+    READER_LOCK_NAME, collect_garbage, create_version, current_version, publish_version, verify_version
+)
+
+BUNDLE_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+# Provenance written next to every built index version and shipped in bundles.
+BUILD_INFO_NAME = "index_info.json"
+# Files of an index version that go into a bundle. Missing optional files
+# (e.g. no file-level index) are skipped.
+BUNDLE_FILES = ["chunks.sqlite", "faiss_index.bin", "file_index.bin", "file_summaries.json", BUILD_INFO_NAME]
+WORKSPACE_FILE = os.path.join(BASE_DIR, "workspace.json")
+# Build settings that must match the importing node. Queries are embedded
+# locally, so vectors from a different embedding model would be meaningless.
+EMBEDDING_KEYS = ("embed_provider", "embed_model", "embed_dimension")
+# Build settings an incremental build must share with the version it starts
+# from, since it keeps that version's chunks and vectors for unchanged files.
+INCREMENTAL_KEYS = EMBEDDING_KEYS + ("chunk_model", "chunking_mode", "dedup", "chunking_prompt_sha256")
+
+
+def _git(repo_dir: str, *args) -> str | None:
+    try:
+        result = subprocess.run(["git", "-C", repo_dir, *args], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def repo_commit(repo_dir: str) -> str | None:
+    """The checked-out commit of a cloned repository, or None if unknown."""
+    return _git(repo_dir, "rev-parse", "HEAD")
+
+
+def repo_url(repo_dir: str) -> str:
+    """The URL a repository was cloned from, or its directory name."""
+    return _git(repo_dir, "config", "--get", "remote.origin.url") or os.path.basename(os.path.normpath(repo_dir))
+
+
+def _sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def model_versions() -> dict:
+    """
+    Models, prompts and chunking settings this node builds indexes with.
+    Prompts are recorded by hash.
+    """
+    from gemini import STAGE1_PROMPT
+    from providers import get_registry
+    from smartChunking import SMART_CHUNKING_PROMPT, SPAN_CHUNKING_PROMPT
+
+    registry = get_registry()
+    return {
+        "embed_provider": registry.embed_provider,
+        "embed_model": registry.embedding().inner.model_name,
+        "embed_dimension": registry.embedding_dimension(),
+        "llm_provider": registry.llm_provider,
+        "stage_one_model": STAGE_ONE_MODEL_NAME,
+        "chunk_model": CHUNK_MODEL_NAME,
+        "chunking_mode": CHUNKING_MODE,
+        "dedup": DEDUP_ENABLED,
+        "stage_one_prompt_sha256": _sha256_text(STAGE1_PROMPT)[:16],
+        "chunking_prompt_sha256": _sha256_text(
+            SPAN_CHUNKING_PROMPT if CHUNKING_MODE == "span" else SMART_CHUNKING_PROMPT
+        )[:16],
+    }
+
+
+def write_build_info(version_dir: str, repo_dir: str, file_paths: list[str], workspace: dict | None = None) -> dict:
+    """
+    Records where an index version came from: repo commit, indexed files,
+    workspace definitions and model/prompt versions.
+    """
+    workspaces = None
+    if os.path.exists(WORKSPACE_FILE):
+        try:
+            with open(WORKSPACE_FILE, "r", encoding="utf-8") as f:
+                workspaces = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"WARNING: Could not read workspace definitions for build info: {e}")
+
+    info = {
+        "repo_url": repo_url(repo_dir),
+        "repo_commit": repo_commit(repo_dir),
+        "files": sorted(file_paths),
+        "workspace": workspace,
+        "workspaces": workspaces,
+        "built_at": time.time(),
+        **model_versions(),
+    }
+    with open(os.path.join(version_dir, BUILD_INFO_NAME), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+    return info
+
+
+def read_manifest(bundle_path: str) -> dict:
+    """
+    Reads a bundle's manifest without extracting the rest of it.
+
+    Raises:
+        ValueError: If the file is not a readable bundle.
+    """
+    try:
+        with tarfile.open(bundle_path, "r:gz") as tar:
+            member = tar.next()
+            if member is None or member.name != MANIFEST_NAME:
+                raise ValueError(f"{bundle_path} has no manifest")
+            manifest = json.load(tar.extractfile(member))
+    except (tarfile.TarError, json.JSONDecodeError, OSError, EOFError) as e:
+        raise ValueError(f"Could not read index bundle {bundle_path}: {e}") from e
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported index bundle format: {manifest.get('format')}")
+    return manifest
+
+
+def export_bundle(version_dir: str, bundle_dir: str = INDEX_BUNDLE_DIR) -> dict:
+    """
+    Packs an index version into a single compressed, content-addressed
+    archive: a manifest (build info plus a SHA-256 per file) followed by the
+    files. The bundle id is the hash of the file checksums, so exporting the
+    same index twice yields the same bundle.
+
+    Returns:
+        The bundle's manifest, with its path under "path".
+    """
+    os.makedirs(bundle_dir, exist_ok=True)
+    # Keep garbage collection away from the version while it is copied
+    lease = FileLock(os.path.join(version_dir, READER_LOCK_NAME), shared=True)
+    lease.try_acquire()
+    try:
+        with tempfile.TemporaryDirectory(dir=bundle_dir) as staging:
+            files = {}
+            for name in BUNDLE_FILES:
+                source = os.path.join(version_dir, name)
+                if not os.path.exists(source):
+                    continue
+                target = os.path.join(staging, name)
+                if name == "chunks.sqlite":
+                    copy_chunk_store(source, target)
+                else:
+                    shutil.copyfile(source, target)
+                files[name] = {"sha256": _sha256_file(target), "size": os.path.getsize(target)}
+            if "chunks.sqlite" not in files or "faiss_index.bin" not in files:
+                raise ValueError(f"{version_dir} is not a complete index version")
+
+            info = {}
+            if BUILD_INFO_NAME in files:
+                with open(os.path.join(staging, BUILD_INFO_NAME), "r", encoding="utf-8") as f:
+                    info = json.load(f)
+
+            bundle_id = _sha256_text(json.dumps({name: f["sha256"] for name, f in files.items()}, sort_keys=True))
+            bundle_name = f"{(info.get('repo_commit') or 'unknown')[:12]}-{bundle_id[:16]}.tar.gz"
+            bundle_path = os.path.join(bundle_dir, bundle_name)
+            if os.path.exists(bundle_path):
+                manifest = read_manifest(bundle_path)
+                manifest["path"] = bundle_path
+                return manifest
+
+            manifest = {
+                "format": BUNDLE_FORMAT,
+                "bundle_id": bundle_id,
+                "created_at": time.time(),
+                "info": info,
+                "files": files,
+            }
+            partial_path = os.path.join(staging, bundle_name)
+            with tarfile.open(partial_path, "w:gz") as tar:
+                # The manifest goes first so it can be read without
+                # decompressing the whole archive.
+                data = json.dumps(manifest, indent=2).encode("utf-8")
+                member = tarfile.TarInfo(MANIFEST_NAME)
+                member.size = len(data)
+                member.mtime = int(manifest["created_at"])
+                tar.addfile(member, io.BytesIO(data))
+                for name in files:
+                    tar.add(os.path.join(staging, name), arcname=name)
+            os.replace(partial_path, bundle_path)
+    finally:
+        lease.release()
+
+    print(f"Exported index bundle {bundle_name} ({len(files)} files)")
+    manifest["path"] = bundle_path
+    return manifest
+
+
+def check_compatible(info: dict, local: dict | None = None):
+    """
+    Raises ValueError if a bundle was embedded with a different model than
+    this node uses.
+    """
+    local = local or model_versions()
+    mismatches = [
+        f"{key}: bundle={info.get(key)!r} local={local.get(key)!r}"
+        for key in EMBEDDING_KEYS if info.get(key) != local.get(key)
+    ]
+    if mismatches:
+        raise ValueError("Index bundle was built with a different embedding model (" + "; ".join(mismatches) + ")")
+
+
+def import_bundle(bundle_path: str, vector_db_dir: str = VECTOR_DB_DIR) -> dict:
+    """
+    Unpacks a bundle into a new index version, verifies every checksum and
+    the index itself, and publishes it as the live version.
+
+    Returns:
+        The bundle's manifest, with the new version id under "version_id".
+
+    Raises:
+        ValueError: If the bundle is malformed, corrupted or incompatible.
+    """
+    manifest = read_manifest(bundle_path)
+    check_compatible(manifest.get("info") or {})
+    expected = manifest.get("files") or {}
+
+    os.makedirs(vector_db_dir, exist_ok=True)
+    version_id, version_dir, lease = create_version(vector_db_dir)
+    published = False
+    try:
+        seen = set()
+        with tarfile.open(bundle_path, "r:gz") as tar:
+            for member in tar:
+                if member.name == MANIFEST_NAME:
+                    continue
+                # Only plain files named in the manifest are written, and
+                # only into the version directory.
+                if member.name not in expected or not member.isfile() or os.path.basename(member.name) != member.name:
+                    raise ValueError(f"Unexpected entry in index bundle: {member.name}")
+                digest = hashlib.sha256()
+                with tar.extractfile(member) as source, open(os.path.join(version_dir, member.name), "wb") as target:
+                    for block in iter(lambda: source.read(1 << 20), b""):
+                        digest.update(block)
+                        target.write(block)
+                if digest.hexdigest() != expected[member.name]["sha256"]:
+                    raise ValueError(f"Checksum mismatch for {member.name} in index bundle")
+                seen.add(member.name)
+        missing = set(expected) - seen
+        if missing:
+            raise ValueError(f"Index bundle is missing {', '.join(sorted(missing))}")
+
+        from providers import get_registry
+        verify_version(version_dir, get_registry().embedding_dimension())
+        publish_version(vector_db_dir, version_id)
+        published = True
+    except (tarfile.TarError, EOFError) as e:
+        raise ValueError(f"Could not read index bundle {bundle_path}: {e}") from e
+    finally:
+        lease.release()
+        if not published:
+            shutil.rmtree(version_dir, ignore_errors=True)
+
+    print(f"Imported index bundle {os.path.basename(bundle_path)} as version {version_id}")
+    manifest["version_id"] = version_id
+    return manifest
+
+
+def restore_workspaces(manifest: dict) -> bool:
+    """
+    Writes the bundle's workspace definitions to workspace.json so the UI
+    lists the workspaces of the imported repo. Returns False if it has none.
+    """
+    workspaces = (manifest.get("info") or {}).get("workspaces")
+    if workspaces is None:
+        return False
+    with open(WORKSPACE_FILE, "w", encoding="utf-8") as f:
+        json.dump(workspaces, f, indent=2)
+    return True
+
+
+def list_bundles(bundle_dir: str = INDEX_BUNDLE_DIR) -> list[dict]:
+    """Manifests of the readable bundles in `bundle_dir`, newest first."""
+    if not os.path.isdir(bundle_dir):
+        return []
+    paths = [
+        os.path.join(bundle_dir, name) for name in os.listdir(bundle_dir) if name.endswith(".tar.gz")
+    ]
+    bundles = []
+    for path in sorted(paths, key=os.path.getmtime, reverse=True):
+        try:
+            manifest = read_manifest(path)
+        except ValueError as e:
+            print(f"WARNING: Skipping unreadable index bundle: {e}")
+            continue
+        manifest["path"] = path
+        bundles.append(manifest)
+    return bundles
+
+
+def find_bundle(commit: str | None, file_paths: list[str] | None = None,
+                bundle_dir: str = INDEX_BUNDLE_DIR) -> str | None:
+    """
+    Returns the newest bundle built from `commit` (and, if given, exactly
+    `file_paths`) with this node's embedding model, or None.
+    """
+    if not commit:
+        return None
+    local = None
+    for manifest in list_bundles(bundle_dir):
+        info = manifest.get("info") or {}
+        if info.get("repo_commit") != commit:
+            continue
+        if file_paths is not None and info.get("files") != sorted(file_paths):
+            continue
+        local = local or model_versions()
+        try:
+            check_compatible(info, local)
+        except ValueError:
+            continue
+        return manifest["path"]
+    return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Export or import portable RepoFlow index bundles.")
+    parser.add_argument("--vector-db", default=VECTOR_DB_DIR, help="index versions directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="bundle the live index version")
+    export_parser.add_argument("--out", default=INDEX_BUNDLE_DIR, help="directory to write the bundle to")
+    import_parser = commands.add_parser("import", help="import a bundle and make it the live index")
+    import_parser.add_argument("bundle", help="path to a .tar.gz bundle")
+    import_parser.add_argument("--restore-workspaces", action="store_true",
+                               help="also overwrite workspace.json with the bundle's workspaces")
+    show_parser = commands.add_parser("show", help="print a bundle's manifest")
+    show_parser.add_argument("bundle", help="path to a .tar.gz bundle")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            current = current_version(args.vector_db)
+            if current is None:
+                print(f"No published index in {args.vector_db}")
+                return 1
+            manifest = export_bundle(current["path"], args.out)
+            print(manifest["path"])
+        elif args.command == "import":
+            manifest = import_bundle(args.bundle, args.vector_db)
+            if args.restore_workspaces:
+                restore_workspaces(manifest)
+            collect_garbage(args.vector_db)
+            print(f"Live index version: {manifest['version_id']}")
+        else:
+            print(json.dumps(read_manifest(args.bundle), indent=2))
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# indexVersions.py
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from fileLock import FileLock
+
+# Layout under the vector DB root:
+#   versions/<version id>/   one complete, immutable index per build
+#   CURRENT                  JSON pointer to the live version, replaced atomically
+VERSIONS_DIR_NAME = "versions"
+CURRENT_POINTER_NAME = "CURRENT"
+# Every process reading (or building) a version holds a shared lock on this
+# file; garbage collection only deletes a version it can lock exclusively.
+READER_LOCK_NAME = ".readers.lock"
+# The chunk vectors of a version, keyed by chunk store id
+FAISS_INDEX_NAME = "faiss_index.bin"
+
+
+def _versions_dir(root: str) -> str:
+    return os.path.join(root, VERSIONS_DIR_NAME)
+
+
+def version_path(root: str, version_id: str) -> str:
+    return os.path.join(_versions_dir(root), version_id)
+
+
+def current_version(root: str) -> dict | None:
+    """
+    Returns the live version pointer ({"generation", "path", "created_at"}),
+    or None if no index has been published.
+    """
+    try:
+        with open(os.path.join(root, CURRENT_POINTER_NAME), "r", encoding="utf-8") as f:
+            pointer = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    pointer["path"] = version_path(root, pointer["generation"])
+    return pointer
+
+
+def create_version(root: str) -> tuple[str, str, FileLock]:
+    """
+    Creates an empty staging directory for a new index build.
+
+    Returns:
+        The version id, its directory, and a shared reader lock on it that
+        keeps garbage collection away until the caller releases it.
+    """
+    version_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    path = version_path(root, version_id)
+    os.makedirs(path)
+    lease = FileLock(os.path.join(path, READER_LOCK_NAME), shared=True)
+    lease.try_acquire()
+    return version_id, path, lease
+
+
+def verify_version(path: str, dimension: int) -> int:
+    """
+    Checks that a built version is complete and consistent before it is
+    published: the chunk store opens, the FAISS index matches the embedding
+    dimension, and both hold the same number of chunks.
+
+    Returns:
+        The number of chunks in the version.
+
+    Raises:
+        ValueError: If the version is incomplete or inconsistent.
+    """
+    import faiss
+    from chunkStore import ChunkStore, CHUNK_STORE_NAME
+
+    store_path = os.path.join(path, CHUNK_STORE_NAME)
+    faiss_path = os.path.join(path, FAISS_INDEX_NAME)
+    if not os.path.exists(store_path):
+        raise ValueError(f"{CHUNK_STORE_NAME} is missing; no chunks were indexed")
+    if not os.path.exists(faiss_path):
+        raise ValueError(f"{FAISS_INDEX_NAME} is missing")
+
+    faiss_index = faiss.read_index(faiss_path)
+    if faiss_index.d != dimension:
+        raise ValueError(f"FAISS index has dimension {faiss_index.d}, expected {dimension}")
+    store = ChunkStore(store_path, read_only=True)
+    try:
+        chunk_count = store.count()
+    finally:
+        store.close()
+    if chunk_count == 0 or chunk_count != faiss_index.ntotal:
+        raise ValueError(f"Chunk store has {chunk_count} chunks but the FAISS index has {faiss_index.ntotal}")
+    return chunk_count
+
+
+def publish_version(root: str, version_id: str):
+    """
+    Makes a verified version live by atomically replacing the CURRENT
+    pointer. Readers see either the old pointer or the new one, never a
+    partial write.
+    """
+    pointer_path = os.path.join(root, CURRENT_POINTER_NAME)
+    tmp_path = f"{pointer_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"generation": version_id, "created_at": time.time()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, pointer_path)
+
+
+def collect_garbage(root: str) -> list[str]:
+    """
+    Deletes versions that are neither live nor held by any reader or builder.
+
+    Returns:
+        The ids of the removed versions.
+    """
+    versions_dir = _versions_dir(root)
+    if not os.path.isdir(versions_dir):
+        return []
+    current = current_version(root)
+    live_id = current["generation"] if current else None
+
+    removed = []
+    for version_id in os.listdir(versions_dir):
+        path = os.path.join(versions_dir, version_id)
+        lock_path = os.path.join(path, READER_LOCK_NAME)
+        # A directory without its lock file is still being created.
+        if version_id == live_id or not os.path.exists(lock_path):
+            continue
+        lock = FileLock(lock_path)
+        if not lock.try_acquire():
+            continue
+        try:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(version_id)
+        finally:
+            lock.release()
+    if removed:
+        print(f"Removed {len(removed)} unused index version(s): {', '.join(sorted(removed))}")
+    return removed
+
+
+class IndexHandle:
+    """
+    One loaded index version: its query engine, retriever, chunk store and
+    chat admission control.
+
+    Requests take a reference with `reader()` for as long as they use the
+    engine. When a newer version is swapped in, the old handle is retired;
+    its files are closed and released once the last in-flight request
+    finishes, so queries already running complete on the version they
+    started with. `on_closed` runs on a thread of its own once the handle
+    has closed.
+    """
+
+    def __init__(self, version_id: str, path: str, query_engine, retriever, chunk_store,
+                 lease: FileLock, on_closed=None, info: dict | None = None, admission=None):
+        self.version_id = version_id
+        self.path = path
+        # Build info (repo, workspace, models) recorded with the version
+        self.info = info or {}
+        # Concurrency limit and in-flight query sharing for this version
+        self.admission = admission
+        self.query_engine = query_engine
+        self.retriever = retriever
+        self._chunk_store = chunk_store
+        self._lease = lease
+        self._on_closed = on_closed
+        self._lock = threading.Lock()
+        self._readers = 0
+        self._retired = False
+        self._closed = False
+
+    @property
+    def readers(self) -> int:
+        return self._readers
+
+    @contextmanager
+    def reader(self):
+        """Holds a reference to this version for the duration of a request."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"Index version {self.version_id} is closed")
+            self._readers += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._readers -= 1
+                close = self._retired and self._readers == 0
+            if close:
+                self._close()
+
+    def retire(self):
+        """Marks the handle as replaced; it closes when its last reader leaves."""
+        with self._lock:
+            self._retired = True
+            close = self._readers == 0
+        if close:
+            self._close()
+
+    def _close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._chunk_store.close()
+        self._lease.release()
+        print(f"Closed index version {self.version_id}")
+        if self._on_closed is not None:
+            # The last reader may be leaving on the event loop, and the
+            # callback deletes old versions from disk
+            threading.Thread(target=self._on_closed, name=f"close-{self.version_id}").start()
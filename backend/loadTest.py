@@ -0,0 +1,483 @@
+# loadTest.py
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from indexBundle import repo_commit
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Bumped when the report layout changes, so old reports aren't compared
+# field by field with new ones.
+REPORT_FORMAT = 1
+
+# Questions sent by simulated chat users. Some are restricted to a path the
+# fixture repository has, to exercise filtered retrieval as well.
+CHAT_QUERIES = [
+    ("How are incoming requests validated?", None),
+    ("Where is the session cache invalidated?", None),
+    ("What does the retry helper do when a call keeps failing?", None),
+    ("How is the configuration loaded?", None),
+    ("Which function formats the report totals?", "src/"),
+    ("How are users looked up by email?", "src/api/"),
+    ("What does the frontend render on the dashboard?", "web/"),
+]
+
+# Vocabulary for the generated fixture files, so chunks differ enough for
+# retrieval to rank them.
+_FIXTURE_TOPICS = [
+    "request", "session", "cache", "user", "email", "retry", "config", "report",
+    "invoice", "token", "queue", "dashboard", "upload", "search", "payment", "audit",
+]
+_FIXTURE_DIRS = ["src/api", "src/core", "src/utils", "web", "docs"]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_fixture_repo(root: str, files: int, lines_per_function: int = 12) -> str:
+    """
+    Creates a small git repository of generated source files to ingest, so a
+    run needs neither network access nor a real project.
+
+    Returns:
+        The repository path, usable as a repoUrl.
+    """
+    repo_dir = os.path.join(root, "fixture-repo")
+    rng = random.Random(files)
+    for i in range(files):
+        directory = _FIXTURE_DIRS[i % len(_FIXTURE_DIRS)]
+        topic = _FIXTURE_TOPICS[i % len(_FIXTURE_TOPICS)]
+        extension = ".md" if directory == "docs" else ".js" if directory == "web" else ".py"
+        path = os.path.join(repo_dir, directory, f"{topic}_{i}{extension}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lines = []
+        for f in range(rng.randint(2, 6)):
+            words = rng.sample(_FIXTURE_TOPICS, 3)
+            lines.append(f"def {topic}_{words[0]}_{f}({words[1]}, {words[2]}):")
+            lines.append(f'    """Handles the {words[0]} {topic} for a {words[1]}."""')
+            lines.extend(f"    {words[2]}_{n} = {words[1]}.get('{rng.choice(_FIXTURE_TOPICS)}')"
+                         for n in range(lines_per_function))
+            lines.append(f"    return {words[2]}_0\n")
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write("\n".join(lines))
+    with open(os.path.join(repo_dir, "README.md"), "w", encoding="utf-8") as fh:
+        fh.write("# Fixture repository\n\nGenerated by loadTest.py for RepoFlow load tests.\n")
+
+    git = ["git", "-C", repo_dir, "-c", "user.name=loadtest", "-c", "user.email=loadtest@localhost"]
+    subprocess.run(["git", "init", "-q", repo_dir], check=True)
+    subprocess.run([*git, "add", "-A"], check=True)
+    subprocess.run([*git, "commit", "-q", "-m", "Load test fixture"], check=True)
+    return repo_dir
+
+
+class Server:
+    """
+    A backend started from a copy of the sources in a scratch directory, so
+    its clones, indexes and state files never touch the real ones.
+    """
+
+    def __init__(self, root: str, port: int, env: dict):
+        self.root = root
+        self.port = port
+        self.env = env
+        self.log_path = os.path.join(root, "server.log")
+        self._process = None
+
+    def start(self, timeout: float = 60.0):
+        server_dir = os.path.join(self.root, "backend")
+        os.makedirs(server_dir)
+        for name in os.listdir(BACKEND_DIR):
+            if name.endswith(".py"):
+                shutil.copy2(os.path.join(BACKEND_DIR, name), server_dir)
+        env = {**os.environ, **self.env, "REPOFLOW_PORT": str(self.port), "PYTHONUNBUFFERED": "1"}
+        self._log = open(self.log_path, "w", encoding="utf-8")
+        self._process = subprocess.Popen(
+            [sys.executable, "main.py"], cwd=server_dir, env=env, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self._process.returncode}; see {self.log_path}")
+            try:
+                status, _, _ = Client(self.port, timeout=2).request("GET", "/")
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Server did not start within {timeout:.0f}s; see {self.log_path}")
+
+    def stop(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        if self._process is not None:
+            self._log.close()
+
+    def log_tail(self, lines: int = 20) -> str:
+        try:
+            with open(self.log_path, "r", encoding="utf-8", errors="replace") as fh:
+                return "".join(fh.readlines()[-lines:])
+        except OSError:
+            return ""
+
+
+class Client:
+    """
+    One simulated user: a keep-alive HTTP connection that reconnects after
+    a failure, like a browser would.
+    """
+
+    def __init__(self, port: int, timeout: float = 120.0):
+        self.port = port
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method: str, path: str, body: dict | None = None) -> tuple[int, object, float]:
+        """Returns the status, the decoded JSON body (or None) and the latency in seconds."""
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        start = time.perf_counter()
+        try:
+            self._conn.request(method, path, body=payload, headers=headers)
+            response = self._conn.getresponse()
+            raw = response.read()
+        except (OSError, http.client.HTTPException):
+            self._conn.close()
+            self._conn = None
+            raise
+        elapsed = time.perf_counter() - start
+        try:
+            data = json.loads(raw) if raw else None
+        except json.JSONDecodeError:
+            data = None
+        return response.status, data, elapsed
+
+
+class Recorder:
+    """Collects every request's outcome, keyed by "METHOD path"."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.ingests = []
+        self.loop_lag = []
+
+    def call(self, client: Client, method: str, path: str, body: dict | None = None):
+        """
+        Sends one request and records it. Connection errors and timeouts
+        are recorded with status 0.
+        """
+        try:
+            status, data, elapsed = client.request(method, path, body)
+        except (OSError, http.client.HTTPException):
+            status, data, elapsed = 0, None, client.timeout
+        with self._lock:
+            self.samples.setdefault(f"{method} {path}", []).append((time.monotonic(), status, elapsed))
+        return status, data
+
+    def record_ingest(self, seconds: float):
+        """Records how long a selected workspace took to become chat-ready."""
+        with self._lock:
+            self.ingests.append(seconds)
+
+
+def _percentile(sorted_values: list[float], p: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+def _endpoint_summary(samples: list[tuple], seconds: float) -> dict:
+    latencies = sorted(elapsed for _, _, elapsed in samples)
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    # 409 (ingest busy) and 429 (backpressure) are the server refusing work
+    # it can't take yet; 5xx and connection failures are errors.
+    errors = sum(1 for _, status, _ in samples if status == 0 or status >= 500)
+    rejected = sum(1 for _, status, _ in samples if status in (409, 429))
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / seconds, 2) if seconds else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4),
+        "rejected": rejected,
+        "rejection_rate": round(rejected / len(samples), 4),
+        "status_counts": statuses,
+    }
+
+
+def _wait_for(recorder: Recorder, client: Client, path: str, ready, stop: threading.Event,
+              interval: float, timeout: float):
+    """Polls `path` like the frontend does until `ready(data)` holds."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not stop.is_set():
+        status, data = recorder.call(client, "GET", path)
+        if status == 200 and data is not None and ready(data):
+            return data
+        stop.wait(interval)
+    return None
+
+
+def _ingest(recorder: Recorder, client: Client, repo: str, stop: threading.Event, args,
+            rng: random.Random) -> bool:
+    """
+    One full user ingest: receive-repo, wait for stage one, pick a workspace
+    and wait until its index is live. Returns whether it completed.
+    """
+    status, _ = recorder.call(client, "POST", "/api/receive-repo", {"repoUrl": repo})
+    if status != 200:
+        return False
+    if _wait_for(recorder, client, "/api/check-workspaces", lambda d: d.get("isReady"), stop,
+                 args.poll_interval, args.ingest_timeout) is None:
+        return False
+    status, workspaces = recorder.call(client, "POST", "/api/get-workspaces")
+    if status != 200 or not workspaces:
+        return False
+
+    before = _wait_for(recorder, client, "/api/check-rag-ready", lambda d: True, stop, args.poll_interval, 10)
+    previous_version = before.get("indexVersion") if before else None
+    start = time.monotonic()
+    status, _ = recorder.call(client, "POST", "/api/select-workspace", rng.choice(workspaces))
+    if status != 200:
+        return False
+    ready = _wait_for(
+        recorder, client, "/api/check-rag-ready",
+        lambda d: d.get("isReady") and d.get("indexVersion") != previous_version,
+        stop, args.poll_interval, args.ingest_timeout
+    )
+    if ready is None:
+        return False
+    recorder.record_ingest(time.monotonic() - start)
+    return True
+
+
+def _chat_user(recorder: Recorder, port: int, stop: threading.Event, args, seed: int):
+    client = Client(port, timeout=args.timeout)
+    rng = random.Random(seed)
+    while not stop.is_set():
+        query, path_prefix = rng.choice(CHAT_QUERIES)
+        body = {"query": query}
+        if path_prefix:
+            body["pathPrefix"] = path_prefix
+        recorder.call(client, "POST", "/api/chat", body)
+        stop.wait(rng.uniform(0, 2 * args.think_time))
+
+
+def _ingest_user(recorder: Recorder, port: int, repo: str, stop: threading.Event, args):
+    client = Client(port, timeout=args.timeout)
+    rng = random.Random(0)
+    while not stop.is_set():
+        _ingest(recorder, client, repo, stop, args, rng)
+        stop.wait(args.ingest_pause)
+
+
+def _lag_sampler(recorder: Recorder, port: int, stop: threading.Event):
+    # Not recorded as traffic: it only reads the server's own lag samples.
+    client = Client(port, timeout=30)
+    while not stop.wait(1.0):
+        try:
+            status, data, _ = client.request("GET", "/api/loop-lag")
+        except (OSError, http.client.HTTPException):
+            continue
+        if status == 200 and data and data.get("calls"):
+            recorder.loop_lag.append(data)
+
+
+def run_load(port: int, repo: str, args) -> dict:
+    """
+    Prepares an index, then runs chat users and a re-ingesting user side by
+    side for `args.duration` seconds and summarises what they saw.
+    """
+    setup = Recorder()
+    if not _ingest(setup, Client(port, timeout=args.timeout), repo, threading.Event(), args, random.Random(0)):
+        raise RuntimeError("The initial ingest did not complete")
+    print(f"Index ready after {setup.ingests[0]:.1f}s; running load for {args.duration}s "
+          f"with {args.users} chat users and {args.ingest_users} ingesting user(s)")
+
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [threading.Thread(target=_chat_user, args=(recorder, port, stop, args, i), daemon=True)
+               for i in range(args.users)]
+    threads += [threading.Thread(target=_ingest_user, args=(recorder, port, repo, stop, args), daemon=True)
+                for _ in range(args.ingest_users)]
+    threads.append(threading.Thread(target=_lag_sampler, args=(recorder, port, stop), daemon=True))
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    stop.wait(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join(args.timeout)
+    elapsed = time.monotonic() - start
+
+    lag = recorder.loop_lag
+    return {
+        "duration_seconds": round(elapsed, 1),
+        "endpoints": {
+            name: _endpoint_summary(samples, elapsed) for name, samples in sorted(recorder.samples.items())
+        },
+        "ingests": {
+            "completed": len(recorder.ingests),
+            "mean_seconds": round(sum(recorder.ingests) / len(recorder.ingests), 2) if recorder.ingests else None,
+            "max_seconds": round(max(recorder.ingests), 2) if recorder.ingests else None,
+        },
+        # Each sample is the server's rolling window; report the worst seen
+        "event_loop_lag": {
+            "samples": len(lag),
+            "p50_ms": max((s["p50_ms"] for s in lag), default=None),
+            "p95_ms": max((s["p95_ms"] for s in lag), default=None),
+            "p99_ms": max((s["p99_ms"] for s in lag), default=None),
+            "max_ms": max((s["max_ms"] for s in lag), default=None),
+        },
+    }
+
+
+def compare(report: dict, baseline: dict) -> list[str]:
+    """Lines describing how a report differs from an earlier one."""
+    if baseline.get("format") != report["format"]:
+        return [f"Baseline has report format {baseline.get('format')}, expected {report['format']}; not compared"]
+
+    def change(new, old):
+        if new is None or old is None:
+            return "n/a"
+        if not old:
+            return f"{old} -> {new}"
+        return f"{old} -> {new} ({(new - old) / old * 100:+.0f}%)"
+
+    lines = [f"Compared with {baseline.get('label') or baseline.get('created_at')}:"]
+    for name, stats in report["endpoints"].items():
+        old = baseline["endpoints"].get(name)
+        if old is None:
+            lines.append(f"  {name}: new endpoint")
+            continue
+        lines.append(f"  {name}: throughput {change(stats['throughput_rps'], old['throughput_rps'])} req/s, "
+                     f"p95 {change(stats['p95_ms'], old['p95_ms'])} ms, "
+                     f"errors {old['error_rate']:.2%} -> {stats['error_rate']:.2%}")
+    lines.append(f"  event-loop lag p99: {change(report['event_loop_lag']['p99_ms'], baseline['event_loop_lag']['p99_ms'])} ms")
+    return lines
+
+
+def print_report(report: dict):
+    print(f"\n{'endpoint':<30} {'reqs':>6} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'err%':>6} {'rej%':>6}")
+    for name, s in report["endpoints"].items():
+        print(f"{name:<30} {s['requests']:>6} {s['throughput_rps']:>7.2f} {s['p50_ms']:>8.0f} "
+              f"{s['p95_ms']:>8.0f} {s['p99_ms']:>8.0f} {s['error_rate'] * 100:>6.1f} {s['rejection_rate'] * 100:>6.1f}")
+    lag = report["event_loop_lag"]
+    if lag["samples"]:
+        print(f"\nEvent-loop lag (worst window): p50 {lag['p50_ms']} ms, p95 {lag['p95_ms']} ms, "
+              f"p99 {lag['p99_ms']} ms, max {lag['max_ms']} ms")
+    ingests = report["ingests"]
+    if ingests["completed"]:
+        print(f"Ingests completed during the run: {ingests['completed']} "
+              f"(mean {ingests['mean_seconds']}s, max {ingests['max_seconds']}s from select to chat-ready)")
+    else:
+        print("No ingest completed during the run")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Drive mixed chat and ingest traffic against a local RepoFlow backend with offline model stubs."
+    )
+    parser.add_argument("--users", type=int, default=20, help="concurrent chat users")
+    parser.add_argument("--ingest-users", type=int, default=1,
+                        help="users repeatedly running receive-repo and select-workspace")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load after the first index is ready")
+    parser.add_argument("--think-time", type=float, default=1.0, help="mean pause between a user's chat requests")
+    parser.add_argument("--ingest-pause", type=float, default=2.0, help="pause between ingests of an ingesting user")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="client polling interval for readiness")
+    parser.add_argument("--ingest-timeout", type=float, default=300, help="give up waiting on one ingest after this")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--model-latency-ms", type=int, default=300,
+                        help="simulated latency of every stubbed model call")
+    parser.add_argument("--model-rpm", type=int, default=6000,
+                        help="model gateway request limit; the stubs have no quota, so the default keeps "
+                             "the limiter out of the way (use 60 to model the production quota)")
+    parser.add_argument("--repo", help="repository URL or path to ingest (default: a generated fixture repo)")
+    parser.add_argument("--fixture-files", type=int, default=40, help="files in the generated fixture repo")
+    parser.add_argument("--label", help="name for this run in the report, e.g. a release tag")
+    parser.add_argument("--report", default="loadtest-report.json", help="where to write the JSON report")
+    parser.add_argument("--baseline", help="earlier report to compare this run with")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory (server log, indexes)")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="repoflow-loadtest-")
+    config = {
+        "users": args.users,
+        "ingest_users": args.ingest_users,
+        "duration": args.duration,
+        "think_time": args.think_time,
+        "workers": args.workers,
+        "model_latency_ms": args.model_latency_ms,
+        "model_rpm": args.model_rpm,
+        "fixture_files": None if args.repo else args.fixture_files,
+    }
+    server = Server(root, _free_port(), {
+        "REPOFLOW_EMBED_PROVIDER": "offline",
+        "REPOFLOW_LLM_PROVIDER": "offline",
+        "REPOFLOW_OFFLINE_LATENCY_MS": str(args.model_latency_ms),
+        "REPOFLOW_MODEL_RPM": str(args.model_rpm),
+        "REPOFLOW_WEB_WORKERS": str(args.workers),
+        "REPOFLOW_BUNDLE_DIR": os.path.join(root, "index_bundles"),
+    })
+    try:
+        repo = args.repo or make_fixture_repo(root, args.fixture_files)
+        server.start()
+        results = run_load(server.port, repo, args)
+    except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+        print(f"FAIL: {e}")
+        print(server.log_tail())
+        return 1
+    finally:
+        server.stop()
+        if args.keep:
+            print(f"Scratch directory kept at {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "format": REPORT_FORMAT,
+        "label": args.label,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": repo_commit(BACKEND_DIR),
+        "config": config,
+        **results,
+    }
+    with open(args.report, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    print_report(report)
+    print(f"\nReport written to {args.report}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as fh:
+            print("\n" + "\n".join(compare(report, json.load(fh))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
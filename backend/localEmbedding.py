@@ -0,0 +1,139 @@
+# localEmbedding.py
+
+import asyncio
+import os
+import re
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+# Splits identifiers into words: "getUserName" / "get_user_name" -> get, user, name
+_WORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def _tokenize(text: str) -> list[str]:
+    return [word.lower() for word in _WORD_PATTERN.findall(text)]
+
+
+class _SentenceTransformerModel:
+    """A sentence-transformers model directory, run on the CPU."""
+
+    def __init__(self, path: str, batch_size: int):
+        from sentence_transformers import SentenceTransformer
+
+        self._model = SentenceTransformer(path, device="cpu")
+        self._batch_size = batch_size
+        self.native_dimension = self._model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        return self._model.encode(
+            texts,
+            batch_size=self._batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        ).astype("float32")
+
+
+class _StaticModel:
+    """
+    A static word-embedding table stored as .npz with a `vocab` string array
+    and a `vectors` float matrix. A text's embedding is the mean of its
+    tokens' vectors, computed for the whole batch in one vectorized pass.
+    """
+
+    def __init__(self, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            vocab = data["vocab"]
+            self._vectors = data["vectors"].astype("float32")
+        self._token_ids = {str(token): i for i, token in enumerate(vocab)}
+        self.native_dimension = self._vectors.shape[1]
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        ids = []
+        owners = []
+        for row, text in enumerate(texts):
+            for token in _tokenize(text):
+                token_id = self._token_ids.get(token)
+                if token_id is not None:
+                    ids.append(token_id)
+                    owners.append(row)
+
+        sums = np.zeros((len(texts), self.native_dimension), dtype="float32")
+        if ids:
+            owners = np.array(owners)
+            np.add.at(sums, owners, self._vectors[np.array(ids)])
+            counts = np.bincount(owners, minlength=len(texts)).astype("float32")
+            sums /= np.maximum(counts, 1.0)[:, None]
+        return sums
+
+
+class LocalEmbedding(BaseEmbedding):
+    """
+    CPU embedding model loaded from disk, so indexing and queries need no
+    network. `path` is either a sentence-transformers model directory
+    (requires the optional sentence-transformers package) or an .npz static
+    embedding table. Vectors are truncated to `dimension` when it is smaller
+    than the model's native size, then L2-normalised.
+    """
+
+    dimension: int = 0
+    _model = PrivateAttr()
+
+    def __init__(self, path: str, dimension: int = 0, batch_size: int = 64, **kwargs):
+        if not path:
+            raise ValueError("REPOFLOW_LOCAL_EMBED_PATH must point to a local embedding model")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Local embedding model not found: {path}")
+
+        if os.path.isdir(path):
+            model = _SentenceTransformerModel(path, batch_size)
+        elif path.endswith(".npz"):
+            model = _StaticModel(path)
+        else:
+            raise ValueError(f"Unsupported local embedding model format: {path}")
+
+        if dimension <= 0:
+            dimension = model.native_dimension
+        if dimension > model.native_dimension:
+            raise ValueError(
+                f"Requested embedding dimension {dimension} exceeds the model's {model.native_dimension}"
+            )
+
+        super().__init__(
+            model_name=os.path.basename(os.path.normpath(path)),
+            embed_batch_size=batch_size,
+            dimension=dimension,
+            **kwargs
+        )
+        self._model = model
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalEmbedding"
+
+    def _encode(self, texts: list[str]) -> list[list[float]]:
+        vectors = self._model.encode(texts)[:, :self.dimension]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors.tolist()
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._encode([query])[0]
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._encode([text])[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._encode(texts)
+
+    # Inference is CPU-bound; the async paths (used by chat queries) run it
+    # on a thread so the event loop keeps serving other requests.
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    async def _aget_text_embedding(self, text: str) -> list[float]:
+        return await asyncio.to_thread(self._get_text_embedding, text)
+
+    async def _aget_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
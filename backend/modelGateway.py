@@ -0,0 +1,517 @@
+# modelGateway.py
+
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from appConfig import (
+    MODEL_GATEWAY_STATE_FILE,
+    MODEL_REQUESTS_PER_MINUTE,
+    MODEL_TOKENS_PER_MINUTE,
+    MODEL_MAX_RETRIES,
+    MODEL_BACKOFF_BASE_SECONDS,
+    MODEL_BACKOFF_MAX_SECONDS,
+    MODEL_BREAKER_FAILURES,
+    MODEL_BREAKER_RESET_SECONDS,
+)
+from fileLock import FileLock
+
+# Priority lanes. Background callers wait while any interactive call is
+# queued, so chat isn't stuck behind a long ingest.
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# Retry hints as they appear in provider error messages, e.g.
+# "retry_delay { seconds: 27 }" or "Please retry in 27.5s".
+_RETRY_HINT_PATTERNS = [
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+(?:\.\d+)?)", re.IGNORECASE),
+    re.compile(r"retry in\s+(\d+(?:\.\d+)?)\s*s", re.IGNORECASE),
+    re.compile(r"retry-after:?\s*(\d+(?:\.\d+)?)", re.IGNORECASE),
+]
+_THROTTLE_MARKERS = ("429", "resource exhausted", "resourceexhausted", "quota", "rate limit")
+_TRANSIENT_MARKERS = ("500", "502", "503", "504", "unavailable", "deadline", "timeout", "timed out", "internal error")
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is rejecting calls."""
+
+
+class FakeRateLimitError(Exception):
+    """Throttling error raised by FakeProvider, carrying a retry hint."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"429 Resource exhausted. Please retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate (~4 characters per token) used for rate limiting.
+    """
+    return len(text) // 4 + 1
+
+
+def _retry_hint(error: Exception) -> float | None:
+    """
+    Extracts the provider's suggested retry delay in seconds, if any.
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if isinstance(retry_after, (int, float)):
+        return float(retry_after)
+
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+
+    message = str(error)
+    for pattern in _RETRY_HINT_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def _classify(error: Exception) -> str:
+    """
+    Returns "throttled", "transient" or "fatal" for a failed model call.
+    """
+    if isinstance(error, FakeRateLimitError):
+        return "throttled"
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code == 429:
+        return "throttled"
+    if isinstance(code, int) and code >= 500:
+        return "transient"
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return "transient"
+
+    message = f"{type(error).__name__} {error}".lower()
+    if any(marker in message for marker in _THROTTLE_MARKERS):
+        return "throttled"
+    if any(marker in message for marker in _TRANSIENT_MARKERS):
+        return "transient"
+    return "fatal"
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at `rate_per_minute`.
+    Not thread-safe on its own; ModelGateway guards it with its lock.
+    """
+
+    def __init__(self, rate_per_minute: float, clock=time.monotonic):
+        self.max_rate = float(rate_per_minute)
+        self.rate = float(rate_per_minute)
+        self.capacity = float(rate_per_minute)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate / 60.0)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) * 60.0 / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self._tokens -= min(amount, self.capacity)
+
+    def slow_down(self):
+        """Halves the refill rate after the provider throttled us."""
+        self._refill()
+        self.rate = max(self.max_rate * 0.05, self.rate * 0.5)
+
+    def speed_up(self):
+        """Recovers the refill rate gradually after successful calls."""
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+    def to_state(self) -> dict:
+        return {"rate": self.rate, "tokens": self._tokens, "updated": self._updated}
+
+    def load_state(self, state: dict):
+        # Clamped, in case the state was written under different limits
+        self.rate = min(self.max_rate, float(state["rate"]))
+        self._tokens = min(self.capacity, float(state["tokens"]))
+        self._updated = float(state["updated"])
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    until `reset_timeout` has passed, then lets a single probe call through.
+    A probe that never reports back (its process died) is given up after
+    another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._probe_at = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and (
+            self._probe_at is None or self._clock() - self._probe_at >= self.reset_timeout
+        ):
+            self._probe_at = self._clock()
+            return True
+        return False
+
+    def release_probe(self):
+        """Hands back a half-open probe slot that wasn't used."""
+        self._probe_at = None
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probe_at = None
+
+    def record_failure(self):
+        self._failures += 1
+        self._probe_at = None
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+
+    def to_state(self) -> dict:
+        return {"failures": self._failures, "opened_at": self._opened_at, "probe_at": self._probe_at}
+
+    def load_state(self, state: dict):
+        self._failures = int(state["failures"])
+        self._opened_at = state["opened_at"]
+        self._probe_at = state["probe_at"]
+
+
+class ModelGateway:
+    """
+    Single entry point for every model call.
+
+    Applies request and token rate limits, retries throttled or transient
+    failures with exponential backoff and jitter (honouring provider retry
+    hints), trips a circuit breaker on repeated outages, and lets
+    interactive calls jump ahead of background ingest work. Throttling is
+    left to the limiter: it slows the request rate down but never counts
+    towards the breaker.
+
+    With a `state_file`, limiter, breaker and lane state are kept in that
+    file instead of in memory, so every process using the same file (web
+    workers and ingest pool processes) shares one set of limits. The
+    `clock` must then be comparable across processes, e.g. time.time.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = MODEL_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = MODEL_TOKENS_PER_MINUTE,
+        max_retries: int = MODEL_MAX_RETRIES,
+        backoff_base: float = MODEL_BACKOFF_BASE_SECONDS,
+        backoff_max: float = MODEL_BACKOFF_MAX_SECONDS,
+        failure_threshold: int = MODEL_BREAKER_FAILURES,
+        reset_timeout: float = MODEL_BREAKER_RESET_SECONDS,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        state_file: str | None = None,
+    ):
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._state_file = state_file
+        self._state_lock = FileLock(f"{state_file}.lock") if state_file else None
+        # Background calls hold back until then, because an interactive call
+        # is queued and will retry admission by that time
+        self._interactive_until = 0.0
+        self._paused_until = 0.0
+
+    # ------------------------------------------------------------------ shared state
+
+    @contextmanager
+    def _state(self):
+        """
+        Guards a read-modify-write of the gateway state. With a state file,
+        the state is loaded under an exclusive file lock and written back
+        before the lock is released.
+        """
+        with self._lock:
+            if self._state_lock is None:
+                yield
+                return
+            self._state_lock.acquire()
+            try:
+                self._load_state()
+                yield
+            finally:
+                try:
+                    self._save_state()
+                finally:
+                    self._state_lock.release()
+
+    def _load_state(self):
+        try:
+            with open(self._state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.requests.load_state(state["requests"])
+            self.tokens.load_state(state["tokens"])
+            self.breaker.load_state(state["breaker"])
+            self._paused_until = float(state["paused_until"])
+            self._interactive_until = float(state["interactive_until"])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # A torn write from a process that died mid-save; start over
+            # from this process's view of the state
+            print(f"WARNING: Ignoring unreadable model gateway state {self._state_file}: {e}")
+
+    def _save_state(self):
+        state = {
+            "requests": self.requests.to_state(),
+            "tokens": self.tokens.to_state(),
+            "breaker": self.breaker.to_state(),
+            "paused_until": self._paused_until,
+            "interactive_until": self._interactive_until,
+        }
+        try:
+            with open(self._state_file, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+        except OSError as e:
+            print(f"WARNING: Could not save model gateway state: {e}")
+
+    # ------------------------------------------------------------------ admission
+
+    def _try_admit(self, priority: int, tokens: int) -> float:
+        """
+        Takes capacity for one call if possible.
+
+        Returns:
+            0 if the call was admitted, otherwise the number of seconds to
+            wait before trying again.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+        """
+        with self._state():
+            if not self.breaker.allow():
+                raise CircuitOpenError(
+                    f"Model calls suspended after repeated failures (breaker {self.breaker.state})"
+                )
+            now = self._clock()
+            wait = max(
+                self._paused_until - now,
+                self.requests.wait_time(1),
+                self.tokens.wait_time(tokens),
+            )
+            if priority == BACKGROUND and self._interactive_until > now:
+                wait = max(wait, 0.05)
+            if wait > 0:
+                self._release_probe()
+                if priority == INTERACTIVE:
+                    # Slightly past our own retry, so the lane stays held
+                    # until we've actually been admitted
+                    self._interactive_until = max(self._interactive_until, now + wait + 0.1)
+                return wait
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            return 0.0
+
+    def _release_probe(self):
+        # A half-open probe slot taken by allow() is handed back if the call
+        # is not actually going out yet.
+        self.breaker.release_probe()
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """
+        Computes the delay before retry `attempt`. Throttling slows the
+        limiter down for everyone; transient errors count towards the
+        breaker.
+        """
+        hint = _retry_hint(error)
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if hint is not None:
+            delay = hint + random.uniform(0, self.backoff_base)
+        with self._state():
+            if _classify(error) == "throttled":
+                self.requests.slow_down()
+                # Everyone waits out the provider's hint, not just this caller.
+                self._paused_until = max(self._paused_until, self._clock() + delay)
+                self._release_probe()
+            else:
+                self.breaker.record_failure()
+        return delay
+
+    def _on_success(self):
+        with self._state():
+            self.breaker.record_success()
+            self.requests.speed_up()
+
+    # ------------------------------------------------------------------ calls
+
+    def call(self, func, *args, priority: int = BACKGROUND, tokens: int = 0, label: str = "model", **kwargs):
+        """
+        Calls `func(*args, **kwargs)` under the gateway's limits and retries.
+
+        Args:
+            func: The blocking model call.
+            priority: INTERACTIVE or BACKGROUND.
+            tokens: Estimated tokens the call will consume.
+            label: Name used in log messages.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+            Exception: The last error once retries are exhausted, or any
+                       non-retryable error immediately.
+        """
+        attempt = 0
+        while True:
+            while (wait := self._try_admit(priority, tokens)) > 0:
+                self._sleep(wait)
+
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if _classify(e) == "fatal" or attempt >= self.max_retries:
+                    self._record_final_failure(e)
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                print(f"  {label} call failed ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                self._sleep(delay)
+                continue
+            self._on_success()
+            return result
+
+    async def acall(self, func, *args, priority: int = INTERACTIVE, tokens: int = 0, label: str = "model", **kwargs):
+        """
+        Async counterpart of call() for coroutine functions; waits with
+        asyncio.sleep so the event loop is never blocked.
+        """
+        attempt = 0
+        while True:
+            while (wait := await self._off_loop(self._try_admit, priority, tokens)) > 0:
+                await asyncio.sleep(wait)
+
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                if _classify(e) == "fatal" or attempt >= self.max_retries:
+                    await self._off_loop(self._record_final_failure, e)
+                    raise
+                delay = await self._off_loop(self._backoff, attempt, e)
+                attempt += 1
+                print(f"  {label} call failed ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            await self._off_loop(self._on_success)
+            return result
+
+    async def _off_loop(self, func, *args):
+        # Shared state means waiting for the state file lock, which another
+        # process may hold, and file I/O; neither may stall the event loop.
+        if self._state_lock is None:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    def _record_final_failure(self, error: Exception):
+        # Bad requests are the caller's problem, and running out of quota is
+        # the limiter's; only outages count against the provider's health.
+        with self._state():
+            if _classify(error) == "transient":
+                self.breaker.record_failure()
+            else:
+                self._release_probe()
+
+    def stats(self) -> dict:
+        """Current limiter and breaker state, for debugging endpoints."""
+        with self._state():
+            now = self._clock()
+            return {
+                "requests_per_minute": round(self.requests.rate, 2),
+                "tokens_per_minute": round(self.tokens.rate, 2),
+                "breaker": self.breaker.state,
+                "interactive_waiting": self._interactive_until > now,
+                "paused_for": max(0.0, round(self._paused_until - now, 2)),
+                "shared": self._state_file is not None,
+            }
+
+
+class FakeResponse:
+    """Minimal stand-in for a provider response object."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeProvider:
+    """
+    Local fake model provider for exercising the gateway without network
+    access. It can add latency, fail the first N calls, or throttle every
+    Nth call with a retry hint.
+    """
+
+    def __init__(self, response_text: str = "[]", latency: float = 0.0, fail_first: int = 0,
+                 throttle_every: int = 0, retry_after: float = 1.0):
+        self.response_text = response_text
+        self.latency = latency
+        self.fail_first = fail_first
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.calls = 0
+
+    def generate_content(self, prompt: str, **kwargs) -> FakeResponse:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.calls <= self.fail_first:
+            raise ConnectionError("503 Service unavailable (fake)")
+        if self.throttle_every and self.calls % self.throttle_every == 0:
+            raise FakeRateLimitError(self.retry_after)
+        return FakeResponse(self.response_text)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> ModelGateway:
+    """
+    Returns this process's handle on the shared gateway, creating it on
+    first use. Every process shares the state in MODEL_GATEWAY_STATE_FILE.
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = ModelGateway(state_file=MODEL_GATEWAY_STATE_FILE, clock=time.time)
+        return _gateway
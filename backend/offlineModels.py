@@ -0,0 +1,161 @@
+# offlineModels.py
+
+import asyncio
+import hashlib
+import json
+import math
+import re
+import time
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import MockLLM
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+
+
+class OfflineEmbedding(BaseEmbedding):
+    """
+    Deterministic hashed bag-of-words embedding. It needs no network or model
+    files, which makes it a stand-in for development, CI and load tests, not
+    a replacement for a real embedding model.
+    """
+
+    dimension: int = 768
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OfflineEmbedding"
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimension
+        for token in _TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dimension] += 1.0 if value & (1 << 63) else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._embed(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    # Hashing long texts is CPU work; keep it off the event loop
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return await asyncio.to_thread(self._embed, query)
+
+    async def _aget_text_embedding(self, text: str) -> list[float]:
+        return await asyncio.to_thread(self._embed, text)
+
+
+_TREE_PATH = re.compile(r"\(path: (.+?)\)\s*$", re.MULTILINE)
+_BATCH_HEADER = re.compile(r"^=== File: (.+?) ===$", re.MULTILINE)
+_NUMBERED_LINE = re.compile(r"^\s*\d+\| ", re.MULTILINE)
+
+
+class OfflineGenerativeModel:
+    """
+    Stand-in for the generative models used by stage one and smart chunking.
+    It answers each prompt with the JSON shape the caller expects, built from
+    the prompt itself: workspaces grouped by top-level directory for a tree
+    listing, and fixed-size line spans (or the whole file in code mode) for
+    chunking requests. `latency` seconds are slept per call to mimic a remote
+    model.
+    """
+
+    def __init__(self, latency: float = 0.0, lines_per_chunk: int = 30, files_per_workspace: int = 12):
+        self.latency = latency
+        self.lines_per_chunk = lines_per_chunk
+        self.files_per_workspace = files_per_workspace
+
+    def generate_content(self, prompt, **kwargs):
+        from modelGateway import FakeResponse
+
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = str(prompt)
+        headers = list(_BATCH_HEADER.finditer(prompt))
+        if headers:
+            sections = {}
+            for i, header in enumerate(headers):
+                end = headers[i + 1].start() if i + 1 < len(headers) else len(prompt)
+                sections[header.group(1)] = prompt[header.end():end].strip("\n")
+            return FakeResponse(json.dumps({path: self._chunks(path, code) for path, code in sections.items()}))
+        if "\nCode:\n" in prompt:
+            head, code = prompt.rsplit("\nCode:\n", 1)
+            path = head.rsplit("File Path:", 1)[-1].strip()
+            return FakeResponse(json.dumps(self._chunks(path, code)))
+        paths = _TREE_PATH.findall(prompt)
+        if paths:
+            return FakeResponse(json.dumps(self._workspaces(paths)))
+        return FakeResponse("[]")
+
+    def _chunks(self, path: str, code: str) -> list[dict]:
+        lines = code.splitlines()
+        numbered = bool(_NUMBERED_LINE.match(code))
+        if not numbered:
+            return [{"file": path, "chunk": 1, "name": "misc", "description": f"Contents of {path}",
+                     "code": code, "keywords": []}]
+        chunks = []
+        for start in range(1, len(lines) + 1, self.lines_per_chunk):
+            chunks.append({
+                "file": path,
+                "chunk": len(chunks) + 1,
+                "name": "misc",
+                "description": f"Lines {start}-{min(len(lines), start + self.lines_per_chunk - 1)} of {path}",
+                "start_line": start,
+                "end_line": min(len(lines), start + self.lines_per_chunk - 1),
+                "keywords": [],
+            })
+        return chunks
+
+    def _workspaces(self, paths: list[str]) -> list[dict]:
+        groups = {}
+        for path in paths:
+            top = path.split("/", 1)[0] if "/" in path else "(root)"
+            groups.setdefault(top, []).append(path)
+        workspaces = []
+        for top, files in sorted(groups.items()):
+            for i in range(0, len(files), self.files_per_workspace):
+                name = top if i == 0 else f"{top} ({i // self.files_per_workspace + 1})"
+                workspaces.append({
+                    "name": name,
+                    "description": f"Files under {top}",
+                    "fileStructure": files[i:i + self.files_per_workspace],
+                    "returnPrompt": f"The user selected {name}",
+                    "assumptions": "Grouped by top-level directory by the offline model",
+                })
+        return workspaces
+
+
+class OfflineLLM(MockLLM):
+    """
+    MockLLM that takes `latency` seconds per completion, so offline chat has
+    the timing profile of a remote model. The async path awaits the delay
+    instead of blocking the event loop.
+    """
+
+    latency: float = 0.0
+
+    def __init__(self, latency: float = 0.0, **kwargs):
+        # MockLLM's constructor only accepts its own fields
+        super().__init__(**kwargs)
+        self.latency = latency
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OfflineLLM"
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return MockLLM.complete(self, prompt, formatted=formatted, **kwargs)
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return MockLLM.complete(self, prompt, formatted=formatted, **kwargs)
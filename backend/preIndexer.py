@@ -0,0 +1,362 @@
+# preIndexer.py
+
+import asyncio
+import json
+import os
+import shutil
+import time
+
+from appConfig import (
+    PREINDEX_ORDER, PREINDEX_MAX_WORKSPACES, PREINDEX_TOKEN_BUDGET, PREINDEX_CONTROL_DIR,
+    WORKSPACE_POPULARITY_FILE
+)
+from indexBundle import BUILD_INFO_NAME, repo_commit, repo_url
+from indexVersions import VERSIONS_DIR_NAME, collect_garbage, current_version, publish_version, verify_version
+from tokenLedger import estimate_ingest
+
+# Written into a version directory once a speculative build has been
+# verified, so any worker can find and publish it.
+PREBUILT_MARKER = ".prebuilt"
+
+# Recent selections count more: a selection's weight halves every week.
+POPULARITY_HALF_LIFE_DAYS = 7
+POPULARITY_MAX_SELECTIONS = 50
+
+POLL_SECONDS = 0.5
+
+
+def record_selection(repo: str, workspace_name: str, path: str = WORKSPACE_POPULARITY_FILE):
+    """Remembers that a workspace of `repo` was selected, for popularity ordering."""
+    history = _read_popularity(path)
+    selections = history.setdefault(repo, {}).setdefault(workspace_name, [])
+    selections.append(time.time())
+    del selections[:-POPULARITY_MAX_SELECTIONS]
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(history, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"WARNING: Could not record workspace selection: {e}")
+
+
+def _read_popularity(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def popularity(repo: str, path: str = WORKSPACE_POPULARITY_FILE) -> dict[str, float]:
+    """Time-decayed selection count of each workspace name of `repo`."""
+    now = time.time()
+    half_life = POPULARITY_HALF_LIFE_DAYS * 86400
+    return {
+        name: sum(0.5 ** ((now - ts) / half_life) for ts in selections)
+        for name, selections in _read_popularity(path).get(repo, {}).items()
+    }
+
+
+def order_workspaces(workspaces: list[dict], tokens: dict[str, int], order: str = PREINDEX_ORDER,
+                     scores: dict[str, float] | None = None) -> list[dict]:
+    """
+    Returns workspaces in the order they should be pre-indexed: "smallest"
+    by estimated tokens, or "popular" by selection score with size breaking
+    ties.
+    """
+    if order == "popular":
+        scores = scores or {}
+        return sorted(workspaces, key=lambda w: (-scores.get(w["name"], 0.0), tokens[w["name"]]))
+    if order != "smallest":
+        print(f"WARNING: Unknown pre-index order {order!r}, using 'smallest'")
+    return sorted(workspaces, key=lambda w: tokens[w["name"]])
+
+
+def find_prebuilt(root: str, commit: str | None, file_paths: list[str]) -> str | None:
+    """
+    Returns the id of an unpublished, pre-built version of `file_paths` at
+    `commit`, or None.
+    """
+    versions_dir = os.path.join(root, VERSIONS_DIR_NAME)
+    if not commit or not os.path.isdir(versions_dir):
+        return None
+    wanted = sorted(file_paths)
+    for version_id in os.listdir(versions_dir):
+        path = os.path.join(versions_dir, version_id)
+        if not os.path.exists(os.path.join(path, PREBUILT_MARKER)):
+            continue
+        try:
+            with open(os.path.join(path, BUILD_INFO_NAME), "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if info.get("repo_commit") == commit and info.get("files") == wanted:
+            return version_id
+    return None
+
+
+class PreIndexer:
+    """
+    Builds likely workspaces of the current repository in the background.
+
+    Builds go through the same pipeline as a selected workspace, one at a
+    time, but stop short of publishing: each finished version stays in the
+    versions directory, held by its reader lease so garbage collection
+    leaves it alone, until the workspace is selected (it is then published
+    as-is) or the repository changes (it is dropped).
+
+    Each build is paused or cancelled through a control file of its own,
+    so builds of different workers never steer each other.
+
+    Args:
+        vector_db_dir: Root of the index versions.
+        build: Coroutine function (repo_dir, file_paths, workspace, control_file)
+               returning (version_id, version_dir, lease) for a verified,
+               unpublished version, or None.
+        is_busy: Returns True while interactive work should have the
+                 machine; builds pause meanwhile.
+        current_repo: Returns the repository users are working on; a run
+                      for any other repository stops.
+        on_published: Coroutine function called after a prebuilt version
+                      was published, to swap it in.
+        on_claim_failed: Coroutine function (repo_dir, file_paths, workspace)
+                         called when a build that a selection was waiting
+                         for fails, to ingest the workspace the normal way.
+    """
+
+    def __init__(self, vector_db_dir: str, build, is_busy, current_repo, on_published, on_claim_failed):
+        self._root = vector_db_dir
+        self._build = build
+        self._is_busy = is_busy
+        self._current_repo = current_repo
+        self._on_published = on_published
+        self._on_claim_failed = on_claim_failed
+        self._task = None
+        self._fallbacks = set()
+        self._repo_dir = None
+        self._stopping = False
+        # Sorted file list -> (version id, lease) of finished builds
+        self._ready = {}
+        self._building = None
+        self._claimed = False
+        self._paused = False
+        self._control_file = None
+        self._builds = 0
+        self._tokens_spent = 0
+
+    async def start(self, repo_dir: str, workspaces: list[dict], tree_file: str):
+        """Stops any previous run and starts pre-indexing `workspaces`."""
+        self.stop()
+        if self._task is not None:
+            # A cancelled build finishes its current model request first
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._stopping = False
+        self._repo_dir = repo_dir
+        self._tokens_spent = 0
+        self._task = asyncio.create_task(self._run(repo_dir, workspaces, tree_file))
+
+    def stop(self):
+        """
+        Stops the current run and drops the versions it built. A build in
+        progress is cancelled at its next model request.
+        """
+        self._stopping = True
+        if self._building is not None:
+            self._set_control("cancel")
+        ready, self._ready = self._ready, {}
+        for _, lease in ready.values():
+            lease.release()
+        if ready:
+            collect_garbage(self._root)
+
+    async def claim(self, repo_dir: str, file_paths: list[str]) -> str | None:
+        """
+        Called when a workspace is selected.
+
+        Returns:
+            "ready" if a prebuilt version was published, "building" if the
+            workspace is being built right now (it is published as soon as
+            it is done), or None if the caller has to build it.
+        """
+        key = tuple(sorted(file_paths))
+        if repo_dir == self._repo_dir:
+            if key in self._ready:
+                version_id, lease = self._ready.pop(key)
+                if await self._publish(version_id, lease):
+                    return "ready"
+            elif key == self._building and not self._stopping:
+                self._claimed = True
+                if self._paused:
+                    self._paused = False
+                    self._set_control(None)
+                return "building"
+
+        # Another worker may have built it
+        commit = await asyncio.to_thread(repo_commit, repo_dir)
+        version_id = await asyncio.to_thread(find_prebuilt, self._root, commit, file_paths)
+        if version_id is not None and await self._publish(version_id, None):
+            return "ready"
+        return None
+
+    async def _publish(self, version_id: str, lease) -> bool:
+        from providers import get_registry
+
+        path = os.path.join(self._root, VERSIONS_DIR_NAME, version_id)
+        try:
+            await asyncio.to_thread(verify_version, path, get_registry().embedding_dimension())
+        except (OSError, ValueError) as e:
+            print(f"WARNING: Pre-built index version {version_id} is unusable: {e}")
+            if lease is not None:
+                lease.release()
+            return False
+        publish_version(self._root, version_id)
+        # Once live it is protected from garbage collection anyway
+        if lease is not None:
+            lease.release()
+        print(f"Published pre-built index version {version_id}")
+        await self._on_published()
+        return True
+
+    async def _run(self, repo_dir: str, workspaces: list[dict], tree_file: str):
+        try:
+            commit = await asyncio.to_thread(repo_commit, repo_dir)
+            tokens = {}
+            for workspace in workspaces:
+                estimate = await asyncio.to_thread(
+                    estimate_ingest, tree_file, repo_dir, workspace["fileStructure"], False
+                )
+                tokens[workspace["name"]] = estimate["total"]["total_tokens"]
+            scores = popularity(repo_url(repo_dir)) if PREINDEX_ORDER == "popular" else None
+            ordered = order_workspaces(workspaces, tokens, PREINDEX_ORDER, scores)
+            print(f"Pre-indexing up to {PREINDEX_MAX_WORKSPACES} workspaces in this order: "
+                  f"{', '.join(w['name'] for w in ordered)}")
+
+            built = 0
+            for workspace in ordered:
+                if built >= PREINDEX_MAX_WORKSPACES or self._should_stop(repo_dir):
+                    break
+                key = tuple(sorted(workspace["fileStructure"]))
+                cost = tokens[workspace["name"]]
+                if self._tokens_spent + cost > PREINDEX_TOKEN_BUDGET:
+                    print(f"Pre-index: skipping {workspace['name']} (~{cost} tokens, over budget)")
+                    continue
+                live = current_version(self._root)
+                if key in self._ready or (live and self._live_matches(live["path"], commit, key)):
+                    continue
+                if find_prebuilt(self._root, commit, list(key)) is not None:
+                    continue
+
+                while self._is_busy() and not self._should_stop(repo_dir):
+                    await asyncio.sleep(POLL_SECONDS)
+                if self._should_stop(repo_dir):
+                    break
+                if await self._build_one(repo_dir, workspace, key):
+                    built += 1
+                    self._tokens_spent += cost
+            print(f"Pre-indexing finished: {built} workspace(s) built, ~{self._tokens_spent} tokens")
+        except Exception as e:
+            print(f"ERROR: Pre-indexing stopped: {e}")
+            import traceback
+            traceback.print_exc()
+
+    async def _build_one(self, repo_dir: str, workspace: dict, key: tuple) -> bool:
+        from smartChunking import BuildCancelled
+
+        print(f"Pre-indexing workspace {workspace['name']} ({len(key)} files)")
+        info = {"name": workspace["name"], "description": workspace.get("description")}
+        self._builds += 1
+        os.makedirs(PREINDEX_CONTROL_DIR, exist_ok=True)
+        self._control_file = os.path.join(PREINDEX_CONTROL_DIR, f"{os.getpid()}-{self._builds}.control")
+        self._building, self._claimed, self._paused = key, False, False
+        pacer = asyncio.create_task(self._pace())
+        built = None
+        try:
+            built = await self._build(repo_dir, list(key), info, self._control_file)
+        except BuildCancelled:
+            print(f"Pre-indexing of {workspace['name']} cancelled")
+        except Exception as e:
+            print(f"WARNING: Pre-indexing of {workspace['name']} failed: {e}")
+        finally:
+            pacer.cancel()
+            self._building, self._paused = None, False
+            self._set_control(None)
+            self._control_file = None
+        if built is None:
+            if self._claimed:
+                self._fall_back(repo_dir, key, info)
+            return False
+
+        version_id, version_dir, lease = built
+        if self._stopping and not self._claimed:
+            lease.release()
+            shutil.rmtree(version_dir, ignore_errors=True)
+            return False
+        with open(os.path.join(version_dir, PREBUILT_MARKER), "w", encoding="utf-8"):
+            pass
+        if self._claimed:
+            # Selected while it was being built
+            if not await self._publish(version_id, lease):
+                self._fall_back(repo_dir, key, info)
+        else:
+            self._ready[key] = (version_id, lease)
+            print(f"Pre-built workspace {workspace['name']} as index version {version_id}")
+        return True
+
+    def _fall_back(self, repo_dir: str, key: tuple, workspace: dict):
+        # The user selected this workspace and is waiting for it, so it is
+        # ingested the normal way. Runs as a task of its own so the
+        # pre-index run isn't held up by it.
+        print(f"Pre-indexing gave no usable index for selected workspace {workspace['name']}, ingesting it normally")
+        task = asyncio.create_task(self._on_claim_failed(repo_dir, list(key), workspace))
+        self._fallbacks.add(task)
+        task.add_done_callback(self._fallbacks.discard)
+
+    def _set_control(self, state: str | None):
+        """Writes "pause" or "cancel" to the build's control file, or removes it (run)."""
+        if self._control_file is None:
+            return
+        try:
+            if state is None:
+                if os.path.exists(self._control_file):
+                    os.remove(self._control_file)
+                return
+            with open(self._control_file, "w", encoding="utf-8") as f:
+                f.write(state)
+        except OSError as e:
+            print(f"WARNING: Could not update the pre-index control file: {e}")
+
+    async def _pace(self):
+        # Pauses the build while interactive work is running, unless the
+        # workspace has been selected and is itself what the user waits for.
+        # The build runs in a process of its own, so pausing it never holds
+        # up an interactive ingest.
+        while not self._stopping:
+            paused = self._is_busy() and not self._claimed
+            if paused != self._paused:
+                self._paused = paused
+                self._set_control("pause" if paused else None)
+            await asyncio.sleep(POLL_SECONDS)
+
+    def _should_stop(self, repo_dir: str) -> bool:
+        current = self._current_repo()
+        return self._stopping or (current is not None and os.path.abspath(current) != os.path.abspath(repo_dir))
+
+    @staticmethod
+    def _live_matches(version_dir: str, commit: str | None, key: tuple) -> bool:
+        try:
+            with open(os.path.join(version_dir, BUILD_INFO_NAME), "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return False
+        return info.get("repo_commit") == commit and tuple(info.get("files") or ()) == key
+
+    def stats(self) -> dict:
+        return {
+            "repo_dir": self._repo_dir,
+            "running": self._task is not None and not self._task.done(),
+            "building": list(self._building) if self._building else None,
+            "paused": self._paused,
+            "ready": {version_id: list(key) for key, (version_id, _) in self._ready.items()},
+            "tokens_spent": self._tokens_spent,
+        }
@@ -0,0 +1,98 @@
+# processPool.py
+
+import asyncio
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from appConfig import PROCESS_POOL_WORKERS
+
+# Shared pool for CPU-bound ingest work. It is created lazily so importing
+# this module (or starting a worker that never ingests) stays cheap.
+# Speculative background builds get a one-process pool of their own: they
+# can be paused mid-build, and a paused build must never hold a slot an
+# interactive ingest is waiting for.
+INGEST_POOL = "ingest"
+BACKGROUND_POOL = "background"
+_POOL_SIZES = {INGEST_POOL: PROCESS_POOL_WORKERS, BACKGROUND_POOL: 1}
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def get_process_pool(kind: str = INGEST_POOL) -> ProcessPoolExecutor | None:
+    """
+    Returns the shared process pool of `kind` (INGEST_POOL or BACKGROUND_POOL),
+    creating it on first use.
+
+    Returns None when process pools are disabled (REPOFLOW_PROCESS_WORKERS=0),
+    in which case callers fall back to running the work on a thread.
+    """
+    if PROCESS_POOL_WORKERS <= 0:
+        return None
+
+    with _pool_lock:
+        if kind not in _pools:
+            # "spawn" avoids forking a process that already runs the event loop
+            # and the HTTP client threads of the model SDKs.
+            _pools[kind] = ProcessPoolExecutor(
+                max_workers=_POOL_SIZES[kind],
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            print(f"Started {kind} process pool with {_POOL_SIZES[kind]} workers")
+        return _pools[kind]
+
+
+def _reset_broken_pool(kind: str):
+    """Drops a pool whose worker died so the next call starts a fresh one."""
+    with _pool_lock:
+        pool = _pools.pop(kind, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_in_process(func, *args, kind: str = INGEST_POOL):
+    """
+    Runs `func(*args)` on a process pool without blocking the event loop.
+
+    `func` and its arguments must be picklable (module-level functions and
+    plain data).
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool(kind)
+    if pool is None:
+        return await loop.run_in_executor(None, func, *args)
+    try:
+        return await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        _reset_broken_pool(kind)
+        raise
+
+
+def run_cpu_bound(func, *args):
+    """
+    Synchronous counterpart of run_in_process for code already running on a
+    worker thread (e.g. FastAPI background tasks).
+    """
+    pool = get_process_pool()
+    if pool is None:
+        return func(*args)
+    try:
+        return pool.submit(func, *args).result()
+    except BrokenProcessPool:
+        _reset_broken_pool(INGEST_POOL)
+        raise
+
+
+def shutdown_process_pool():
+    """Stops the worker processes of every pool."""
+    with _pool_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown_process_pool)
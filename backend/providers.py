@@ -0,0 +1,353 @@
+# providers.py
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from appConfig import (
+    GOOGLE_API_KEY,
+    EMBED_PROVIDER,
+    LLM_PROVIDER,
+    CHAT_MODEL_NAME,
+    EMBED_DIMENSION,
+    LOCAL_EMBED_PATH,
+    LOCAL_EMBED_BATCH_SIZE,
+    OFFLINE_MODEL_LATENCY_MS,
+    PROVIDER_STATS_DIR,
+)
+
+# Native embedding size of providers whose size isn't read from a model file.
+GEMINI_EMBED_DIMENSION = 768
+OFFLINE_EMBED_DIMENSION = 768
+# How often a process publishes its latency stats, and how long published
+# stats of a process that stopped making calls are still reported.
+PUBLISH_INTERVAL_SECONDS = 2.0
+STATS_MAX_AGE_SECONDS = 3600
+
+
+def _summarize(calls: int, errors: int, samples: list[float]) -> dict:
+    samples = sorted(samples)
+    if not samples:
+        return {"calls": calls, "errors": errors}
+
+    def percentile(p):
+        return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 1)
+
+    return {
+        "calls": calls,
+        "errors": errors,
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 1),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(samples[-1] * 1000, 1),
+    }
+
+
+class LatencyStats:
+    """
+    Rolling latency and error counters for one provider. `on_record` is
+    called after every recorded call.
+    """
+
+    def __init__(self, window: int = 500, on_record=None):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._on_record = on_record
+        self.calls = 0
+        self.errors = 0
+
+    @contextmanager
+    def track(self):
+        """Times the wrapped call and records whether it raised."""
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(time.perf_counter() - start, ok)
+
+    def record(self, seconds: float, ok: bool = True):
+        """Adds one measured duration."""
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self._samples.append(seconds)
+        if self._on_record is not None:
+            self._on_record()
+
+    def to_state(self) -> dict:
+        """Counters and recent samples, for merging with other processes' stats."""
+        with self._lock:
+            return {"calls": self.calls, "errors": self.errors, "samples": list(self._samples)}
+
+    def snapshot(self) -> dict:
+        state = self.to_state()
+        return _summarize(state["calls"], state["errors"], state["samples"])
+
+
+class _TrackedModel:
+    """
+    Proxy around a generative model that records latency for generate_content.
+    """
+
+    def __init__(self, model, stats: LatencyStats):
+        self._model = model
+        self._stats = stats
+
+    def generate_content(self, *args, **kwargs):
+        with self._stats.track():
+            return self._model.generate_content(*args, **kwargs)
+
+
+class ProviderRegistry:
+    """
+    Creates each model client once per process and hands out the same
+    long-lived instance to every caller, so HTTP/gRPC connections are reused.
+    Backends are chosen by configuration; SDKs are only imported when a
+    client is first requested.
+    """
+
+    def __init__(self, embed_provider: str = EMBED_PROVIDER, llm_provider: str = LLM_PROVIDER,
+                 api_key: str = GOOGLE_API_KEY, stats_dir: str | None = PROVIDER_STATS_DIR):
+        self.embed_provider = embed_provider
+        self.llm_provider = llm_provider
+        self.api_key = api_key
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._stats = {}
+        self._genai_configured = False
+        # Latency stats are published to stats_dir/<pid>.json, so the web
+        # workers can report calls made in the ingest pool processes too
+        self._stats_dir = stats_dir
+        self._process_id = os.getpid()
+        self._publish_lock = threading.Lock()
+        self._published_at = 0.0
+
+    def _stats_for(self, name: str) -> LatencyStats:
+        with self._lock:
+            if name not in self._stats:
+                self._stats[name] = LatencyStats(on_record=self._publish_soon)
+            return self._stats[name]
+
+    def track(self, name: str):
+        """Context manager recording one call against provider `name`."""
+        return self._stats_for(name).track()
+
+    def _require_api_key(self):
+        if not self.api_key:
+            raise ValueError(
+                "GOOGLE_API_KEY is not set. Export it (or put it in backend/.env), or set "
+                "REPOFLOW_EMBED_PROVIDER=offline and REPOFLOW_LLM_PROVIDER=offline to run without Gemini."
+            )
+
+    def missing_api_key(self) -> bool:
+        """True if a Gemini provider is configured but no API key is."""
+        return not self.api_key and "gemini" in (self.embed_provider, self.llm_provider)
+
+    def _cached(self, key: str, factory):
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = factory()
+            return self._clients[key]
+
+    def embedding(self):
+        """
+        Returns the shared embedding model. Remote backends are wrapped so
+        their calls go through the model gateway.
+        """
+        def build():
+            from gatewayEmbedding import GatewayEmbedding
+
+            stats = self._stats_for(f"{self.embed_provider}-embedding")
+            if self.embed_provider == "offline":
+                from offlineModels import OfflineEmbedding
+                inner = OfflineEmbedding(dimension=EMBED_DIMENSION or OFFLINE_EMBED_DIMENSION)
+                return GatewayEmbedding(inner, stats=stats, rate_limited=False)
+            if self.embed_provider == "local":
+                from localEmbedding import LocalEmbedding
+                inner = LocalEmbedding(LOCAL_EMBED_PATH, dimension=EMBED_DIMENSION,
+                                       batch_size=LOCAL_EMBED_BATCH_SIZE)
+                return GatewayEmbedding(inner, stats=stats, rate_limited=False)
+            if self.embed_provider == "gemini":
+                from llama_index.embeddings.gemini import GeminiEmbedding
+                if EMBED_DIMENSION and EMBED_DIMENSION != GEMINI_EMBED_DIMENSION:
+                    raise ValueError(f"Gemini embeddings are {GEMINI_EMBED_DIMENSION}-dimensional; "
+                                     f"REPOFLOW_EMBED_DIMENSION={EMBED_DIMENSION} is not supported")
+                self._require_api_key()
+                inner = GeminiEmbedding(api_key=self.api_key)
+                return GatewayEmbedding(inner, stats=stats)
+            raise ValueError(f"Unknown embedding provider: {self.embed_provider}")
+
+        return self._cached("embedding", build)
+
+    def embed_batch_size(self) -> int:
+        """
+        Texts per embedding request, without creating the embedding client
+        when it doesn't exist yet.
+        """
+        with self._lock:
+            client = self._clients.get("embedding")
+        if client is not None:
+            return client.embed_batch_size
+        if self.embed_provider == "local":
+            return LOCAL_EMBED_BATCH_SIZE
+        from llama_index.core.constants import DEFAULT_EMBED_BATCH_SIZE
+        return DEFAULT_EMBED_BATCH_SIZE
+
+    def embedding_dimension(self) -> int:
+        """
+        Size of the vectors produced by the configured embedding backend.
+        FAISS indexes are created with this dimension.
+        """
+        if self.embed_provider == "gemini":
+            return GEMINI_EMBED_DIMENSION
+        if self.embed_provider == "offline":
+            return EMBED_DIMENSION or OFFLINE_EMBED_DIMENSION
+        # Local models report their size once loaded (after truncation).
+        return self.embedding().inner.dimension
+
+    def llm(self):
+        """
+        Returns the shared LlamaIndex LLM used for answer synthesis, wrapped
+        so its calls go through the model gateway.
+        """
+        def build():
+            from gatewayLLM import GatewayLLM
+
+            stats = self._stats_for(f"{self.llm_provider}-llm")
+            if self.llm_provider == "offline":
+                from offlineModels import OfflineLLM
+                inner = OfflineLLM(latency=OFFLINE_MODEL_LATENCY_MS / 1000)
+                return GatewayLLM(inner, stats=stats, rate_limited=False)
+            if self.llm_provider == "gemini":
+                from llama_index.llms.gemini import Gemini
+                self._require_api_key()
+                if CHAT_MODEL_NAME:
+                    inner = Gemini(api_key=self.api_key, model=CHAT_MODEL_NAME)
+                else:
+                    inner = Gemini(api_key=self.api_key)
+                return GatewayLLM(inner, stats=stats)
+            raise ValueError(f"Unknown LLM provider: {self.llm_provider}")
+
+        return self._cached("llm", build)
+
+    def generative_model(self, model_name: str):
+        """
+        Returns a shared generative model exposing generate_content, used for
+        stage one and smart chunking.
+        """
+        def build():
+            if self.llm_provider == "offline":
+                from offlineModels import OfflineGenerativeModel
+                model = OfflineGenerativeModel(latency=OFFLINE_MODEL_LATENCY_MS / 1000)
+            elif self.llm_provider == "gemini":
+                import google.generativeai as genai
+                self._require_api_key()
+                if not self._genai_configured:
+                    genai.configure(api_key=self.api_key)
+                    self._genai_configured = True
+                model = genai.GenerativeModel(model_name)
+            else:
+                raise ValueError(f"Unknown LLM provider: {self.llm_provider}")
+            return _TrackedModel(model, self._stats_for(f"{self.llm_provider}:{model_name}"))
+
+        return self._cached(f"generative:{model_name}", build)
+
+    def stats(self) -> dict:
+        """Per-provider latency statistics for this process."""
+        with self._lock:
+            names = list(self._stats)
+        return {
+            "embed_provider": self.embed_provider,
+            "llm_provider": self.llm_provider,
+            "providers": {name: self._stats[name].snapshot() for name in names},
+        }
+
+    def _stats_path(self, process_id) -> str:
+        return os.path.join(self._stats_dir, f"{process_id}.json")
+
+    def _publish_soon(self):
+        # Called after every model call, possibly on the event loop: publish
+        # at most every PUBLISH_INTERVAL_SECONDS, from a thread of its own
+        if self._stats_dir is None or time.monotonic() - self._published_at < PUBLISH_INTERVAL_SECONDS:
+            return
+        self._published_at = time.monotonic()
+        threading.Thread(target=self.publish_stats, args=(False,), name="provider-stats", daemon=True).start()
+
+    def publish_stats(self, wait: bool = True):
+        """
+        Writes this process's latency stats for other processes to read.
+        Processes that finish a unit of work (e.g. an ingest) call it so the
+        last calls are not left unpublished. With wait=False it does nothing
+        if another publish is under way.
+        """
+        if self._stats_dir is None or not self._publish_lock.acquire(blocking=wait):
+            return
+        try:
+            with self._lock:
+                states = {name: stats.to_state() for name, stats in self._stats.items()}
+            os.makedirs(self._stats_dir, exist_ok=True)
+            path = self._stats_path(self._process_id)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"updated_at": time.time(), "providers": states}, f)
+            os.replace(tmp_path, path)
+            self._published_at = time.monotonic()
+        except OSError as e:
+            print(f"WARNING: Could not publish provider stats: {e}")
+        finally:
+            self._publish_lock.release()
+
+    def shared_stats(self) -> dict:
+        """
+        Per-provider latency statistics of every process on this host (web
+        workers and ingest pool processes) that made model calls within the
+        last STATS_MAX_AGE_SECONDS, merged.
+        """
+        with self._lock:
+            states = [{name: stats.to_state() for name, stats in self._stats.items()}]
+        own_file = f"{self._process_id}.json"
+        if self._stats_dir is not None and os.path.isdir(self._stats_dir):
+            for name in os.listdir(self._stats_dir):
+                if not name.endswith(".json") or name == own_file:
+                    continue
+                try:
+                    with open(os.path.join(self._stats_dir, name), "r", encoding="utf-8") as f:
+                        published = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if time.time() - published.get("updated_at", 0) <= STATS_MAX_AGE_SECONDS:
+                    states.append(published.get("providers") or {})
+
+        merged = {}
+        for providers in states:
+            for name, state in providers.items():
+                total = merged.setdefault(name, {"calls": 0, "errors": 0, "samples": []})
+                total["calls"] += state["calls"]
+                total["errors"] += state["errors"]
+                total["samples"].extend(state["samples"])
+        return {
+            "embed_provider": self.embed_provider,
+            "llm_provider": self.llm_provider,
+            "processes": len(states),
+            "providers": {name: _summarize(**total) for name, total in merged.items()},
+        }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ProviderRegistry:
+    """Returns the process-wide provider registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ProviderRegistry()
+        return _registry
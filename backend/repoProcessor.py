@@ -8,6 +8,8 @@ import shutil
 
 from fastapi import HTTPException
 
+from processPool import run_cpu_bound
+
 # Define a base directory for storing cloned repositories
 # It's a good practice to use a dedicated directory for this.
 REPOS_DIR = "cloned_repos"
@@ -118,8 +120,9 @@ def process_repository(repo_url: str):
             detail={"message": f"An unexpected error occurred: {e}", "err": True}
         )
 
-    # After successful cloning, create the tree structure
-    tree_structure = create_tree_structure(target_dir, repo_name)
+    # After successful cloning, create the tree structure. Walking a large
+    # repository is CPU-bound, so it runs on the ingest process pool.
+    tree_structure = run_cpu_bound(create_tree_structure, target_dir, repo_name)
     print("Generated tree structure")
 
     # Define the path for the tree structure file
@@ -0,0 +1,86 @@
+# startupBenchmark.py
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from appConfig import STARTUP_BUDGET_MS
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules that must not be imported before the first request needs them.
+HEAVY_MODULES = ["llama_index", "faiss", "google.generativeai", "torch", "sentence_transformers"]
+
+# Runs in a fresh interpreter. It measures `import main` plus the app's
+# startup hook, then exits with os._exit so neither the shutdown hook nor the
+# atexit cleanup touch the real data directories.
+_CHILD_CODE = """
+import asyncio, json, os, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def _startup():
+    context = main.app.router.lifespan_context(main.app)
+    await context.__aenter__()
+
+asyncio.run(_startup())
+ready = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "ready_ms": (ready - start) * 1000,
+    "heavy_modules": [m for m in HEAVY_MODULES if m in sys.modules],
+}), flush=True)
+os._exit(0)
+"""
+
+
+def measure_once() -> dict:
+    """
+    Starts a fresh interpreter and returns its import-to-ready timings.
+    """
+    code = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n{_CHILD_CODE}"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # The app may print while importing; the measurement is the last line.
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure RepoFlow backend cold-start time.")
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh interpreters to start")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS,
+                        help="fail if the median import-to-ready time exceeds this")
+    args = parser.parse_args()
+
+    samples = [measure_once() for _ in range(args.runs)]
+    ready = [s["ready_ms"] for s in samples]
+    heavy = sorted({m for s in samples for m in s["heavy_modules"]})
+    median = statistics.median(ready)
+
+    print(f"Cold start over {args.runs} runs: median {median:.0f} ms, "
+          f"min {min(ready):.0f} ms, max {max(ready):.0f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"Median import time: {statistics.median(s['import_ms'] for s in samples):.0f} ms")
+
+    failed = False
+    if median > args.budget_ms:
+        print("FAIL: startup exceeded its budget")
+        failed = True
+    if heavy:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(heavy)}")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,12 @@
+# conftest.py
+
+import os
+import sys
+
+# Tests run against the local stand-ins only; nothing may reach a real
+# provider. Set before appConfig is first imported.
+os.environ.setdefault("REPOFLOW_EMBED_PROVIDER", "offline")
+os.environ.setdefault("REPOFLOW_LLM_PROVIDER", "offline")
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
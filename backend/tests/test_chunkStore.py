@@ -0,0 +1,85 @@
+# test_chunkStore.py
+
+import pytest
+from llama_index.core.schema import TextNode
+
+from chunkStore import ChunkStore, _prefix_upper_bound
+
+
+def _node(node_id: str, file_path: str, name: str = "misc", duplicates: list[str] | None = None) -> TextNode:
+    metadata = {"file": file_path, "name": name}
+    if duplicates:
+        metadata["duplicate_files"] = duplicates
+    return TextNode(id_=node_id, text=f"text of {node_id}", metadata=metadata)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ChunkStore(str(tmp_path / "chunks.sqlite"))
+    yield store
+    store.close()
+
+
+def test_add_nodes_records_file_hashes(store):
+    ids = store.add_nodes([_node("a1", "src/a.py"), _node("a2", "src/a.py")], {"src/a.py": "hash-a"})
+    assert len(ids) == 2
+    assert store.file_hashes() == {"src/a.py": "hash-a"}
+    assert [node.node_id for node in store.get_nodes(ids)] == ["a1", "a2"]
+
+
+def test_delete_files_only_touches_their_rows(store):
+    a_ids = store.add_nodes([_node("a1", "src/a.py"), _node("a2", "src/a.py")], {"src/a.py": "hash-a"})
+    b_ids = store.add_nodes([_node("b1", "src/b.py")], {"src/b.py": "hash-b"})
+
+    deleted, files = store.delete_files(["src/a.py"])
+
+    assert deleted == sorted(a_ids)
+    assert files == {"src/a.py"}
+    assert store.count() == 1
+    assert store.file_hashes() == {"src/b.py": "hash-b"}
+    assert store.filter_ids(files=["src/b.py"]) == b_ids
+
+
+def test_delete_files_takes_files_sharing_a_chunk_along(store):
+    # b.py is a duplicate of a.py; c.py shares a chunk with b.py
+    store.add_nodes([_node("a1", "a.py", duplicates=["b.py"])], {"a.py": "ha", "b.py": "hb"})
+    store.add_nodes([_node("c1", "c.py", duplicates=["b.py"]), _node("c2", "c.py")], {"c.py": "hc"})
+    d_ids = store.add_nodes([_node("d1", "d.py")], {"d.py": "hd"})
+
+    deleted, files = store.delete_files(["a.py"])
+
+    assert files == {"a.py", "b.py", "c.py"}
+    assert len(deleted) == 3
+    assert store.filter_ids() == d_ids
+    assert store.indexed_files() == {"d.py"}
+
+
+def test_delete_files_is_one_transaction(store):
+    store.add_nodes([_node("a1", "a.py")], {"a.py": "ha"})
+    # Make the final statement of the transaction fail
+    store._conn.execute("CREATE TRIGGER fail BEFORE DELETE ON files BEGIN SELECT RAISE(ABORT, 'boom'); END")
+
+    with pytest.raises(Exception, match="boom"):
+        store.delete_files(["a.py"])
+    assert store.count() == 1
+
+
+def test_path_prefix_filter_is_case_sensitive_range(store):
+    src = store.add_nodes([_node("s1", "src/a.py"), _node("s2", "src/sub/b.py")])
+    store.add_nodes([_node("u1", "Src/a.py"), _node("x1", "src0/a.py"), _node("y1", "srd.py")])
+
+    assert store.filter_ids(path_prefix="src/") == src
+    assert len(store.filter_ids(path_prefix="src")) == 3
+
+
+def test_path_prefix_filter_uses_the_primary_key(store):
+    plan = store._conn.execute(
+        "EXPLAIN QUERY PLAN SELECT chunk_id FROM chunk_files WHERE file >= ? AND file < ?", ["src/", "src0"]
+    ).fetchall()
+    assert any("USING PRIMARY KEY" in row[-1] for row in plan)
+
+
+def test_prefix_upper_bound():
+    assert _prefix_upper_bound("src/") == "src0"
+    assert _prefix_upper_bound("a\U0010ffff") == "b"
+    assert _prefix_upper_bound("\U0010ffff") is None
@@ -0,0 +1,89 @@
+# test_hierarchicalRetriever.py
+
+import asyncio
+import os
+
+import faiss
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+
+from chunkStore import ChunkStore, CHUNK_STORE_NAME
+from hierarchicalRetriever import HierarchicalRetriever, build_file_index, load_file_index
+from offlineModels import OfflineEmbedding
+
+DIMENSION = 16
+FILES = {
+    "src/app.py": ["def main():\n    serve()\n", "def serve():\n    listen(8080)\n"],
+    "src/db.py": ["def connect():\n    return open_pool()\n", "def query(sql):\n    return run(sql)\n"],
+    "src/util.py": ["def slugify(text):\n    return text.lower()\n", "def chunks(items, n):\n    return items[:n]\n"],
+    "docs/notes.py": ["def todo():\n    pass\n", "def later():\n    pass\n"],
+}
+
+
+@pytest.fixture
+def indexed(tmp_path):
+    """Chunk store, chunk index and file-level index of FILES, embedded offline."""
+    embed_model = OfflineEmbedding(dimension=DIMENSION)
+    nodes = [
+        TextNode(text=text, metadata={"file": file_path, "name": text.split("(")[0][4:]})
+        for file_path, texts in FILES.items() for text in texts
+    ]
+    store = ChunkStore(os.path.join(tmp_path, CHUNK_STORE_NAME))
+    ids = store.add_nodes(nodes)
+    vectors = embed_model.get_text_embedding_batch([node.text for node in nodes])
+    chunk_index = faiss.IndexIDMap2(faiss.IndexFlatL2(DIMENSION))
+    chunk_index.add_with_ids(np.array(vectors, dtype="float32"), np.array(ids, dtype="int64"))
+    build_file_index(store, embed_model, str(tmp_path), DIMENSION)
+    file_index, entries = load_file_index(str(tmp_path))
+    yield store, chunk_index, file_index, entries, embed_model
+    store.close()
+
+
+def _files(results) -> set[str]:
+    return {result.node.metadata["file"] for result in results}
+
+
+def test_file_stage_limits_the_chunk_candidates(indexed):
+    store, chunk_index, file_index, entries, embed_model = indexed
+    retriever = HierarchicalRetriever(store, chunk_index, file_index, entries, embed_model, top_files=1, top_k=5)
+
+    results = retriever.retrieve("open a database connection")
+
+    # Only the best file's two chunks are candidates
+    assert len(results) == 2 and len(_files(results)) == 1
+    assert [r.score for r in results] == sorted(r.score for r in results)
+
+    flat = HierarchicalRetriever(store, chunk_index, None, None, embed_model, top_k=5)
+    assert len(flat.retrieve("open a database connection")) == 5
+
+
+def test_file_stage_honours_metadata_filters(indexed):
+    store, chunk_index, file_index, entries, embed_model = indexed
+    retriever = HierarchicalRetriever(store, chunk_index, file_index, entries, embed_model, top_files=1, top_k=5)
+
+    results = asyncio.run(retriever.with_filters(path_prefix="docs/").aretrieve("open a database connection"))
+
+    assert _files(results) == {"docs/notes.py"}
+    assert retriever.with_filters(path_prefix="missing/").retrieve("anything") == []
+
+
+@pytest.mark.parametrize("file_entries", [
+    lambda entries: [],
+    lambda entries: [{**entry, "chunk_ids": []} for entry in entries],
+], ids=["empty-file-index", "files-without-chunks"])
+def test_empty_file_stage_falls_back_to_flat_retrieval(indexed, file_entries):
+    store, chunk_index, file_index, entries, embed_model = indexed
+    entries = file_entries(entries)
+    if not entries:
+        file_index = faiss.IndexFlatL2(DIMENSION)
+    retriever = HierarchicalRetriever(store, chunk_index, file_index, entries, embed_model, top_files=1, top_k=5)
+
+    assert len(retriever.retrieve("open a database connection")) == 5
+    assert _files(retriever.with_filters(path_prefix="src/db").retrieve("anything")) == {"src/db.py"}
+
+
+def test_zero_top_k_retrieves_nothing(indexed):
+    store, chunk_index, file_index, entries, embed_model = indexed
+    retriever = HierarchicalRetriever(store, chunk_index, file_index, entries, embed_model, top_k=0)
+    assert retriever.retrieve("open a database connection") == []
@@ -0,0 +1,239 @@
+# test_indexBundle.py
+
+import asyncio
+import io
+import json
+import os
+import tarfile
+
+import faiss
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+
+import indexBundle
+import main
+from chunkStore import ChunkStore, CHUNK_STORE_NAME
+from fileLock import FileLock
+from indexBundle import (
+    BUILD_INFO_NAME, MANIFEST_NAME, check_compatible, export_bundle, find_bundle, import_bundle, model_versions,
+    read_manifest
+)
+from indexVersions import VERSIONS_DIR_NAME, create_version, current_version, publish_version, verify_version
+from providers import get_registry
+
+COMMIT = "0123456789abcdef0123456789abcdef01234567"
+FILES = ["src/app.py", "src/util.py"]
+
+
+@pytest.fixture
+def version_dir(tmp_path) -> str:
+    """A small published index version, embedded with the offline model."""
+    root = str(tmp_path / "source_db")
+    version_id, path, lease = create_version(root)
+    nodes = [
+        TextNode(text="def main():\n    run()\n", metadata={"file": "src/app.py", "name": "main"}),
+        TextNode(text="def run():\n    return 1\n", metadata={"file": "src/util.py", "name": "run"}),
+    ]
+    store = ChunkStore(os.path.join(path, CHUNK_STORE_NAME))
+    ids = store.add_nodes(nodes)
+    store.close()
+
+    registry = get_registry()
+    vectors = registry.embedding().get_text_embedding_batch([node.text for node in nodes])
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(registry.embedding_dimension()))
+    index.add_with_ids(np.array(vectors, dtype="float32"), np.array(ids, dtype="int64"))
+    faiss.write_index(index, os.path.join(path, "faiss_index.bin"))
+
+    info = {
+        "repo_url": "https://example.com/repo.git",
+        "repo_commit": COMMIT,
+        "files": sorted(FILES),
+        "workspaces": [{"name": "App", "fileStructure": FILES}],
+        **model_versions(),
+    }
+    with open(os.path.join(path, BUILD_INFO_NAME), "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    publish_version(root, version_id)
+    lease.release()
+    return path
+
+
+def _repack(bundle_path: str, target: str, manifest=None, files=None, extra=None) -> str:
+    """
+    Rewrites a bundle, optionally with a changed manifest, changed file
+    contents or extra entries.
+    """
+    contents = {}
+    with tarfile.open(bundle_path, "r:gz") as tar:
+        for member in tar:
+            contents[member.name] = tar.extractfile(member).read()
+    if manifest is not None:
+        contents[MANIFEST_NAME] = json.dumps(manifest(json.loads(contents[MANIFEST_NAME]))).encode()
+    contents.update(files or {})
+    contents.update(extra or {})
+
+    with tarfile.open(target, "w:gz") as tar:
+        for name in [MANIFEST_NAME] + [name for name in contents if name != MANIFEST_NAME]:
+            member = tarfile.TarInfo(name)
+            member.size = len(contents[name])
+            tar.addfile(member, io.BytesIO(contents[name]))
+    return target
+
+
+def _versions(root: str) -> list[str]:
+    versions_dir = os.path.join(root, VERSIONS_DIR_NAME)
+    return os.listdir(versions_dir) if os.path.isdir(versions_dir) else []
+
+
+def test_export_then_import_publishes_an_identical_index(version_dir, tmp_path):
+    manifest = export_bundle(version_dir, str(tmp_path / "bundles"))
+    assert read_manifest(manifest["path"])["bundle_id"] == manifest["bundle_id"]
+    assert manifest["info"]["repo_commit"] == COMMIT
+
+    target_root = str(tmp_path / "target_db")
+    imported = import_bundle(manifest["path"], target_root)
+    current = current_version(target_root)
+    assert current["generation"] == imported["version_id"]
+    assert verify_version(current["path"], get_registry().embedding_dimension()) == 2
+    with open(os.path.join(current["path"], BUILD_INFO_NAME), "r", encoding="utf-8") as f:
+        assert json.load(f)["files"] == sorted(FILES)
+
+
+def test_bundles_are_content_addressed(version_dir, tmp_path):
+    first = export_bundle(version_dir, str(tmp_path / "bundles"))
+    second = export_bundle(version_dir, str(tmp_path / "bundles"))
+    assert first["bundle_id"] == second["bundle_id"]
+    assert first["path"] == second["path"]
+    assert len(os.listdir(tmp_path / "bundles")) == 1
+
+
+def test_tampered_file_is_rejected_and_nothing_is_published(version_dir, tmp_path):
+    bundle = export_bundle(version_dir, str(tmp_path / "bundles"))["path"]
+    with open(os.path.join(version_dir, "faiss_index.bin"), "rb") as f:
+        data = bytearray(f.read())
+    data[-1] ^= 0xFF
+    tampered = _repack(bundle, str(tmp_path / "tampered.tar.gz"), files={"faiss_index.bin": bytes(data)})
+
+    target_root = str(tmp_path / "target_db")
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        import_bundle(tampered, target_root)
+    assert current_version(target_root) is None
+    assert _versions(target_root) == []
+
+
+def test_missing_file_is_rejected(version_dir, tmp_path):
+    bundle = export_bundle(version_dir, str(tmp_path / "bundles"))["path"]
+
+    def add_file(manifest):
+        manifest["files"]["file_index.bin"] = {"sha256": "0" * 64, "size": 1}
+        return manifest
+
+    incomplete = _repack(bundle, str(tmp_path / "incomplete.tar.gz"), manifest=add_file)
+    with pytest.raises(ValueError, match="missing file_index.bin"):
+        import_bundle(incomplete, str(tmp_path / "target_db"))
+
+
+def test_entries_outside_the_manifest_are_rejected(version_dir, tmp_path):
+    bundle = export_bundle(version_dir, str(tmp_path / "bundles"))["path"]
+    escaping = _repack(bundle, str(tmp_path / "escaping.tar.gz"), extra={"../evil.py": b"print('hi')"})
+    target_root = str(tmp_path / "target_db")
+    with pytest.raises(ValueError, match="Unexpected entry"):
+        import_bundle(escaping, target_root)
+    assert not os.path.exists(tmp_path / "evil.py")
+    assert _versions(target_root) == []
+
+
+def test_bundle_from_another_embedding_model_is_rejected(version_dir, tmp_path):
+    bundle = export_bundle(version_dir, str(tmp_path / "bundles"))["path"]
+
+    def other_model(manifest):
+        manifest["info"]["embed_model"] = "some-other-embedding-model"
+        return manifest
+
+    foreign = _repack(bundle, str(tmp_path / "foreign.tar.gz"), manifest=other_model)
+    target_root = str(tmp_path / "target_db")
+    with pytest.raises(ValueError, match="different embedding model"):
+        import_bundle(foreign, target_root)
+    assert _versions(target_root) == []
+
+
+def test_check_compatible_compares_embedding_settings_only():
+    local = {"embed_provider": "offline", "embed_model": "m", "embed_dimension": 768, "chunk_model": "a"}
+    check_compatible({**local, "chunk_model": "b"}, local)
+    with pytest.raises(ValueError, match="embed_dimension"):
+        check_compatible({**local, "embed_dimension": 384}, local)
+
+
+def test_unreadable_bundle_is_rejected(tmp_path):
+    path = tmp_path / "not-a-bundle.tar.gz"
+    path.write_bytes(b"definitely not gzip")
+    with pytest.raises(ValueError, match="Could not read index bundle"):
+        read_manifest(str(path))
+
+
+def test_find_bundle_matches_commit_files_and_model(version_dir, tmp_path):
+    bundle_dir = str(tmp_path / "bundles")
+    path = export_bundle(version_dir, bundle_dir)["path"]
+    assert find_bundle(COMMIT, FILES, bundle_dir) == path
+    assert find_bundle(COMMIT, None, bundle_dir) == path
+    assert find_bundle(COMMIT, ["src/app.py"], bundle_dir) is None
+    assert find_bundle("f" * 40, FILES, bundle_dir) is None
+    assert find_bundle(None, FILES, bundle_dir) is None
+
+    def other_model(manifest):
+        manifest["info"]["embed_dimension"] = 384
+        return manifest
+
+    foreign_dir = tmp_path / "foreign"
+    foreign_dir.mkdir()
+    _repack(path, str(foreign_dir / "foreign.tar.gz"), manifest=other_model)
+    assert find_bundle(COMMIT, FILES, str(foreign_dir)) is None
+
+
+@pytest.fixture
+def app_state(tmp_path, monkeypatch):
+    """Points the app's data files at tmp_path, with a stale clone of another repo."""
+    base = tmp_path / "app"
+    base.mkdir()
+    for module, name in ((main, "BASE_DIR"), (indexBundle, "BASE_DIR")):
+        monkeypatch.setattr(module, name, str(base))
+    monkeypatch.setattr(indexBundle, "WORKSPACE_FILE", str(base / "workspace.json"))
+    monkeypatch.setattr(main, "REPO_STATE_FILE", str(base / "repo_state.json"))
+    monkeypatch.setattr(main, "STAGE_ONE_LEDGER_FILE", str(base / "stage_one_usage.jsonl"))
+    monkeypatch.setattr(main, "VECTOR_DB_DIR", str(tmp_path / "db"))
+    monkeypatch.setattr(main, "INDEX_BUNDLE_DIR", str(tmp_path / "bundles"))
+    monkeypatch.setattr(main, "INGEST_LOCK", FileLock(str(base / "ingest.lock")))
+    monkeypatch.setattr(main, "RAG_INDEX", None)
+    monkeypatch.setattr(main, "RAG_LOADING", None)
+    stopped = []
+    monkeypatch.setattr(main.PREINDEXER, "stop", lambda: stopped.append(True))
+
+    old_repo = tmp_path / "repos" / "other"
+    old_repo.mkdir(parents=True)
+    monkeypatch.setattr(main, "LATEST_REPO_PATH", str(old_repo))
+    main._save_repo_state(str(old_repo))
+    (base / "workspace.json").write_text(json.dumps([{"name": "Other"}]))
+    (base / "tree_structure.txt").write_text("other\n")
+    yield base, stopped
+    if main.RAG_INDEX is not None:
+        main.RAG_INDEX.retire()
+
+
+def test_import_endpoint_serves_the_bundle_and_replaces_repo_state(version_dir, app_state, monkeypatch):
+    base, stopped = app_state
+    bundle = export_bundle(version_dir, main.INDEX_BUNDLE_DIR)
+
+    async def scenario():
+        monkeypatch.setattr(main, "RAG_SWAP_LOCK", asyncio.Lock())
+        return await main.import_index(main.ImportIndexRequest(bundleName=os.path.basename(bundle["path"])))
+
+    result = asyncio.run(scenario())
+
+    assert main.RAG_INDEX.version_id == result["indexVersion"]
+    assert main._latest_repo_path() is None
+    assert json.loads((base / "workspace.json").read_text()) == [{"name": "App", "fileStructure": FILES}]
+    assert not (base / "tree_structure.txt").exists()
+    assert stopped == [True]
+    assert main.INGEST_LOCK.try_acquire()
+    main.INGEST_LOCK.release()
@@ -0,0 +1,102 @@
+# test_indexVersions.py
+
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+import main
+from fileLock import FileLock
+from indexVersions import READER_LOCK_NAME, IndexHandle, create_version, publish_version
+
+
+class FakeStore:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def make_handle(version_id: str, on_closed=None) -> IndexHandle:
+    # The lease is never taken; releasing it does nothing
+    return IndexHandle(version_id, "", query_engine=None, retriever=None, chunk_store=FakeStore(),
+                       lease=FileLock(os.devnull), on_closed=on_closed)
+
+
+def test_retired_handle_closes_when_its_last_reader_leaves():
+    closed_on = []
+    done = threading.Event()
+
+    def on_closed():
+        closed_on.append(threading.current_thread())
+        done.set()
+
+    handle = make_handle("v1", on_closed=on_closed)
+    with handle.reader():
+        handle.retire()
+        assert not handle._chunk_store.closed
+    assert handle._chunk_store.closed
+    assert done.wait(1)
+    # Garbage collection runs off the caller's thread
+    assert closed_on[0] is not threading.current_thread()
+    with pytest.raises(RuntimeError):
+        with handle.reader():
+            pass
+
+
+@pytest.fixture
+def vector_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "VECTOR_DB_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "RAG_INDEX", None)
+    monkeypatch.setattr(main, "RAG_LOADING", None)
+    return tmp_path
+
+
+def test_requests_keep_the_old_version_while_a_new_one_loads(vector_db, monkeypatch):
+    old_id, old_dir, old_lease = create_version(str(vector_db))
+    old_lease.release()
+    new_id, new_dir, new_lease = create_version(str(vector_db))
+    new_lease.release()
+    publish_version(str(vector_db), new_id)
+    old = make_handle(old_id)
+    monkeypatch.setattr(main, "RAG_INDEX", old)
+
+    load_started = threading.Event()
+
+    def slow_load(version_id, version_dir):
+        load_started.set()
+        time.sleep(0.3)
+        return make_handle(version_id)
+
+    monkeypatch.setattr(main, "_load_rag_model", slow_load)
+
+    async def scenario():
+        monkeypatch.setattr(main, "RAG_SWAP_LOCK", asyncio.Lock())
+        start = time.perf_counter()
+        await main._ensure_rag_loaded(wait=False)
+        assert time.perf_counter() - start < 0.2
+        assert main.RAG_INDEX is old
+        await asyncio.to_thread(load_started.wait, 1)
+        # The swap lock is free while the version loads
+        assert not main.RAG_SWAP_LOCK.locked()
+        await main._ensure_rag_loaded()
+        assert main.RAG_INDEX.version_id == new_id
+
+    asyncio.run(scenario())
+    assert old._chunk_store.closed
+
+
+def test_load_fails_without_a_reader_lease(vector_db, monkeypatch):
+    version_id, version_dir, lease = create_version(str(vector_db))
+    lease.release()
+    # A collector holds the version exclusively
+    collector = FileLock(os.path.join(version_dir, READER_LOCK_NAME))
+    assert collector.try_acquire()
+    monkeypatch.setattr(main, "READER_LEASE_ATTEMPTS", 2)
+    try:
+        assert main._load_rag_model(version_id, version_dir) is None
+    finally:
+        collector.release()
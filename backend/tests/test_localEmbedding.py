@@ -0,0 +1,51 @@
+# test_localEmbedding.py
+
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from localEmbedding import LocalEmbedding
+from offlineModels import OfflineEmbedding
+
+
+@pytest.fixture
+def static_model(tmp_path):
+    path = tmp_path / "static.npz"
+    vocab = np.array(["get", "user", "name", "parse"])
+    vectors = np.eye(4, dtype="float32")
+    np.savez(path, vocab=vocab, vectors=vectors)
+    return str(path)
+
+
+def test_static_model_embeds_identifier_words(static_model):
+    model = LocalEmbedding(static_model, dimension=3)
+    vector = model.get_query_embedding("getUserName")
+    assert len(vector) == 3
+    assert np.linalg.norm(vector) == pytest.approx(1.0)
+    assert vector[0] == pytest.approx(vector[1])
+
+
+@pytest.mark.parametrize("factory, compute", [
+    (lambda path: LocalEmbedding(path), "_encode"),
+    (lambda path: OfflineEmbedding(dimension=16), "_embed"),
+], ids=["local", "offline"])
+def test_async_query_embedding_runs_off_the_event_loop(static_model, monkeypatch, factory, compute):
+    model = factory(static_model)
+    threads = []
+    original = getattr(type(model), compute)
+
+    def recording(self, *args):
+        threads.append(threading.current_thread())
+        return original(self, *args)
+
+    monkeypatch.setattr(type(model), compute, recording)
+
+    async def embed():
+        return threading.current_thread(), await model.aget_query_embedding("parse user")
+
+    loop_thread, vector = asyncio.run(embed())
+
+    assert len(threads) == 1 and threads[0] is not loop_thread
+    assert vector == model.get_query_embedding("parse user")
@@ -0,0 +1,347 @@
+# test_modelGateway.py
+
+import asyncio
+
+import pytest
+
+from fileLock import FileLock
+from modelGateway import (
+    BACKGROUND, INTERACTIVE, CircuitBreaker, CircuitOpenError, FakeProvider, FakeRateLimitError, ModelGateway,
+    TokenBucket, _classify, _retry_hint
+)
+
+
+class FakeClock:
+    """A clock that only moves when something sleeps on it."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_gateway(clock: FakeClock, **kwargs) -> ModelGateway:
+    settings = dict(requests_per_minute=60, tokens_per_minute=10_000, max_retries=3, backoff_base=1.0,
+                    backoff_max=8.0, failure_threshold=2, reset_timeout=30.0)
+    settings.update(kwargs)
+    return ModelGateway(clock=clock, sleep=clock.sleep, **settings)
+
+
+# ---------------------------------------------------------------- token bucket
+
+def test_bucket_starts_full_and_refills_at_its_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock)
+    for _ in range(60):
+        assert bucket.wait_time(1) == 0
+        bucket.take(1)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.wait_time(1) == 0
+
+
+def test_bucket_caps_oversized_requests_at_capacity():
+    bucket = TokenBucket(100, FakeClock())
+    # A call bigger than a minute's budget still goes out once the bucket is full
+    assert bucket.wait_time(1_000) == 0
+
+
+def test_bucket_slows_down_and_recovers_within_bounds():
+    bucket = TokenBucket(100, FakeClock())
+    for _ in range(10):
+        bucket.slow_down()
+    assert bucket.rate == pytest.approx(5.0)
+    for _ in range(100):
+        bucket.speed_up()
+    assert bucket.rate == pytest.approx(100.0)
+
+
+def test_bucket_state_round_trips_and_is_clamped_to_its_limits():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock)
+    bucket.take(20)
+    bucket.slow_down()
+    copy = TokenBucket(60, clock)
+    copy.load_state(bucket.to_state())
+    assert copy.rate == bucket.rate
+    assert copy.wait_time(41) == bucket.wait_time(41)
+
+    smaller = TokenBucket(10, clock)
+    smaller.load_state({"rate": 60.0, "tokens": 60.0, "updated": clock.now})
+    assert smaller.rate == 10.0
+    assert smaller.wait_time(10) == 0 and smaller.wait_time(11) == 0  # capped at capacity
+
+
+# ---------------------------------------------------------------- error handling
+
+@pytest.mark.parametrize("message, expected", [
+    ("429 Resource exhausted. retry_delay { seconds: 27 }", 27.0),
+    ("Quota exceeded. Please retry in 12.5s.", 12.5),
+    ("Too many requests, Retry-After: 3", 3.0),
+    ("503 Service unavailable", None),
+])
+def test_retry_hint_is_read_from_the_message(message, expected):
+    assert _retry_hint(Exception(message)) == expected
+
+
+def test_retry_hint_prefers_the_error_attribute():
+    assert _retry_hint(FakeRateLimitError(4.0)) == 4.0
+
+
+@pytest.mark.parametrize("error, expected", [
+    (FakeRateLimitError(1.0), "throttled"),
+    (Exception("429 Resource exhausted"), "throttled"),
+    (ConnectionError("connection reset"), "transient"),
+    (Exception("503 Service unavailable"), "transient"),
+    (TimeoutError(), "transient"),
+    (ValueError("400 Invalid argument"), "fatal"),
+])
+def test_errors_are_classified(error, expected):
+    assert _classify(error) == expected
+
+
+# ---------------------------------------------------------------- circuit breaker
+
+def test_breaker_opens_after_threshold_then_probes_once():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now += 30
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # only one probe at a time
+
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_probe_reopens_the_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_lost_probe_is_given_up_after_the_reset_timeout():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+# ---------------------------------------------------------------- gateway calls
+
+def test_transient_errors_are_retried_with_backoff():
+    clock = FakeClock()
+    gateway = make_gateway(clock, failure_threshold=5)
+    provider = FakeProvider(response_text="ok", fail_first=2)
+    assert gateway.call(provider.generate_content, "prompt").text == "ok"
+    assert provider.calls == 3
+    assert len(clock.sleeps) == 2
+    assert all(0 <= delay <= 8.0 for delay in clock.sleeps)
+    assert gateway.breaker.state == "closed"
+
+
+def test_throttling_honours_the_hint_and_pauses_other_callers():
+    clock = FakeClock()
+    gateway = make_gateway(clock)
+    provider = FakeProvider(response_text="ok", throttle_every=2, retry_after=10.0)
+    gateway.call(provider.generate_content, "first")
+    gateway.call(provider.generate_content, "second")  # throttled once, then succeeds
+
+    assert provider.calls == 3
+    assert 10.0 <= clock.sleeps[0] <= 11.0
+    assert gateway.requests.rate < 60  # slowed down, not fully recovered yet
+
+
+def test_throttling_never_opens_the_breaker():
+    clock = FakeClock()
+    gateway = make_gateway(clock, failure_threshold=1)
+    provider = FakeProvider(throttle_every=1, retry_after=1.0)
+    with pytest.raises(FakeRateLimitError):
+        gateway.call(provider.generate_content, "prompt")
+    assert provider.calls == 4
+    assert gateway.breaker.state == "closed"
+
+
+def test_outage_opens_the_breaker_and_recovers_after_the_timeout():
+    clock = FakeClock()
+    gateway = make_gateway(clock, max_retries=0)
+    provider = FakeProvider(response_text="ok", fail_first=2)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            gateway.call(provider.generate_content, "prompt")
+    with pytest.raises(CircuitOpenError):
+        gateway.call(provider.generate_content, "prompt")
+    assert provider.calls == 2
+
+    clock.now += 30
+    assert gateway.call(provider.generate_content, "prompt").text == "ok"
+    assert gateway.breaker.state == "closed"
+
+
+def test_fatal_errors_are_not_retried_and_do_not_count():
+    clock = FakeClock()
+    gateway = make_gateway(clock, failure_threshold=1)
+    calls = []
+
+    def bad_request(prompt):
+        calls.append(prompt)
+        raise ValueError("400 Invalid argument")
+
+    with pytest.raises(ValueError):
+        gateway.call(bad_request, "prompt")
+    assert len(calls) == 1
+    assert gateway.breaker.state == "closed"
+
+
+def test_request_limit_spaces_calls_out():
+    clock = FakeClock()
+    gateway = make_gateway(clock, requests_per_minute=2)
+    provider = FakeProvider(response_text="ok")
+    for _ in range(3):
+        gateway.call(provider.generate_content, "prompt")
+    assert sum(clock.sleeps) == pytest.approx(30.0)
+
+
+def test_token_limit_holds_large_calls_back():
+    clock = FakeClock()
+    gateway = make_gateway(clock, tokens_per_minute=1_000)
+    provider = FakeProvider(response_text="ok")
+    gateway.call(provider.generate_content, "prompt", tokens=1_000)
+    gateway.call(provider.generate_content, "prompt", tokens=500)
+    assert sum(clock.sleeps) == pytest.approx(30.0)
+
+
+def test_waiting_interactive_call_holds_background_calls_back():
+    clock = FakeClock()
+    gateway = make_gateway(clock, requests_per_minute=60)
+    for _ in range(60):
+        assert gateway._try_admit(BACKGROUND, 0) == 0
+
+    # Chat has to wait for capacity, and background work must not take it
+    wait = gateway._try_admit(INTERACTIVE, 0)
+    assert wait == pytest.approx(1.0)
+    clock.now += wait
+    assert gateway._try_admit(BACKGROUND, 0) > 0
+    assert gateway._try_admit(INTERACTIVE, 0) == 0
+
+    # Once chat has gone out the lane frees up again
+    clock.now += 1.1
+    assert gateway._try_admit(BACKGROUND, 0) == 0
+
+
+def test_acall_retries_without_blocking_the_loop():
+    clock = FakeClock()
+    gateway = make_gateway(clock, backoff_base=0.001, backoff_max=0.001, failure_threshold=5)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("503 Service unavailable")
+        return "ok"
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(ticker())
+        result = await gateway.acall(flaky, priority=INTERACTIVE)
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(main())
+    assert result == "ok" and len(attempts) == 3
+    assert ticks > 0
+
+
+# ---------------------------------------------------------------- shared state
+
+def test_gateways_sharing_a_state_file_share_one_limit(tmp_path):
+    clock = FakeClock()
+    state_file = str(tmp_path / "gateway.json")
+    first = make_gateway(clock, requests_per_minute=10, state_file=state_file)
+    second = make_gateway(clock, requests_per_minute=10, state_file=state_file)
+    for _ in range(6):
+        assert first._try_admit(BACKGROUND, 0) == 0
+    for _ in range(4):
+        assert second._try_admit(BACKGROUND, 0) == 0
+    assert first._try_admit(BACKGROUND, 0) > 0
+    assert second._try_admit(BACKGROUND, 0) > 0
+
+
+def test_breaker_and_lane_are_shared_through_the_state_file(tmp_path):
+    clock = FakeClock()
+    state_file = str(tmp_path / "gateway.json")
+    chat = make_gateway(clock, requests_per_minute=1, failure_threshold=1, max_retries=0, state_file=state_file)
+    ingest = make_gateway(clock, requests_per_minute=1, failure_threshold=1, max_retries=0,
+                          state_file=state_file)
+
+    assert ingest._try_admit(BACKGROUND, 0) == 0
+    assert chat._try_admit(INTERACTIVE, 0) > 0  # chat now waits for the next slot
+    clock.now += 60
+    assert ingest._try_admit(BACKGROUND, 0) > 0  # and ingest lets it have it
+    assert chat._try_admit(INTERACTIVE, 0) == 0
+
+    clock.now += 60
+    with pytest.raises(ConnectionError):
+        chat.call(FakeProvider(fail_first=1).generate_content, "prompt", priority=INTERACTIVE)
+    with pytest.raises(CircuitOpenError):
+        ingest._try_admit(BACKGROUND, 0)
+
+
+def test_unreadable_state_file_is_ignored(tmp_path):
+    state_file = tmp_path / "gateway.json"
+    state_file.write_text("{not json")
+    gateway = make_gateway(FakeClock(), state_file=str(state_file))
+    assert gateway._try_admit(BACKGROUND, 0) == 0
+    assert gateway.stats()["shared"]
+
+
+def test_acall_waits_for_the_state_lock_off_the_event_loop(tmp_path):
+    state_file = str(tmp_path / "gateway.json")
+    gateway = make_gateway(FakeClock(), state_file=state_file)
+    # Another process is in the middle of updating the shared state
+    holder = FileLock(f"{state_file}.lock")
+    holder.acquire()
+
+    async def answer():
+        return "answer"
+
+    async def scenario():
+        call = asyncio.create_task(gateway.acall(answer, priority=INTERACTIVE))
+        ticks = 0
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert not call.done()
+        holder.release()
+        return ticks, await call
+
+    assert asyncio.run(scenario()) == (5, "answer")
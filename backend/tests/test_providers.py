@@ -0,0 +1,67 @@
+# test_providers.py
+
+import json
+import os
+import time
+
+import pytest
+
+from providers import LatencyStats, ProviderRegistry, STATS_MAX_AGE_SECONDS
+
+
+def test_latency_stats_summarise_recent_samples():
+    stats = LatencyStats(window=3)
+    for seconds in (9.0, 0.1, 0.2, 0.3):
+        stats.record(seconds)
+    stats.record(0.4, ok=False)
+    snapshot = stats.snapshot()
+    assert snapshot["calls"] == 5
+    assert snapshot["errors"] == 1
+    # Only the window's samples count towards latencies
+    assert snapshot["max_ms"] == 400.0
+    assert snapshot["mean_ms"] == pytest.approx(300.0)
+
+
+def _registry(stats_dir, process_id) -> ProviderRegistry:
+    registry = ProviderRegistry("offline", "offline", "", stats_dir=str(stats_dir))
+    registry._process_id = process_id
+    return registry
+
+
+def test_shared_stats_merge_every_process(tmp_path):
+    web = _registry(tmp_path, 1)
+    ingest = _registry(tmp_path, 2)
+    web._stats_for("offline-llm").record(0.1)
+    ingest._stats_for("offline:chunk-model").record(2.0)
+    ingest._stats_for("offline:chunk-model").record(4.0)
+    ingest._stats_for("offline-llm").record(0.3, ok=False)
+    ingest.publish_stats()
+
+    shared = web.shared_stats()
+    assert shared["processes"] == 2
+    assert shared["providers"]["offline:chunk-model"]["mean_ms"] == pytest.approx(3000.0)
+    assert shared["providers"]["offline-llm"]["calls"] == 2
+    assert shared["providers"]["offline-llm"]["errors"] == 1
+    # The web process's own view is unchanged
+    assert "offline:chunk-model" not in web.stats()["providers"]
+
+
+def test_shared_stats_skip_stale_and_unreadable_files(tmp_path):
+    (tmp_path / "3.json").write_text(json.dumps({
+        "updated_at": time.time() - STATS_MAX_AGE_SECONDS - 1,
+        "providers": {"old": {"calls": 1, "errors": 0, "samples": [1.0]}},
+    }))
+    (tmp_path / "4.json").write_text("{torn")
+    shared = _registry(tmp_path, 1).shared_stats()
+    assert shared["processes"] == 1
+    assert shared["providers"] == {}
+
+
+def test_recording_publishes_in_the_background(tmp_path):
+    registry = _registry(tmp_path, 7)
+    registry._stats_for("offline-llm").record(0.5)
+    deadline = time.time() + 2
+    while not os.path.exists(tmp_path / "7.json") and time.time() < deadline:
+        time.sleep(0.01)
+    published = json.loads((tmp_path / "7.json").read_text())
+    assert published["providers"]["offline-llm"]["samples"] == [0.5]
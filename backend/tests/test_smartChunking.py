@@ -0,0 +1,269 @@
+# test_smartChunking.py
+
+import json
+import os
+from types import SimpleNamespace
+
+import faiss
+import pytest
+from llama_index.core import Document
+from llama_index.core.node_parser import SimpleNodeParser
+
+import smartChunking
+from chunkStore import ChunkStore, CHUNK_STORE_NAME
+from indexBundle import write_build_info
+from indexVersions import FAISS_INDEX_NAME, verify_version
+from providers import get_registry
+
+# ---------------------------------------------------------------- incremental builds
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo_dir = tmp_path / "repo"
+    (repo_dir / "src").mkdir(parents=True)
+    for name, body in {"a.py": "def a():\n    return 1\n", "b.py": "def b():\n    return 2\n",
+                       "c.py": "def c():\n    return 3\n"}.items():
+        (repo_dir / "src" / name).write_text(body)
+    return repo_dir
+
+
+@pytest.fixture
+def chunked(monkeypatch):
+    """Records the files each build sends to the chunking model."""
+    calls = []
+    original = smartChunking._chunk_files
+
+    def recording(file_paths, contents, *args, **kwargs):
+        calls.append(sorted(file_paths))
+        return original(file_paths, contents, *args, **kwargs)
+
+    monkeypatch.setattr(smartChunking, "_chunk_files", recording)
+    return calls
+
+
+def _build(repo_dir, files, version_dir, base_dir=None):
+    os.makedirs(version_dir)
+    smartChunking.smart_chunking(str(repo_dir), files, str(version_dir), base_dir=base_dir)
+    write_build_info(str(version_dir), str(repo_dir), files)
+    return verify_version(str(version_dir), get_registry().embedding_dimension())
+
+
+def _files(version_dir) -> dict[str, list[str]]:
+    store = ChunkStore(os.path.join(version_dir, CHUNK_STORE_NAME), read_only=True)
+    try:
+        return {file_path: [chunk["metadata"]["name"] for chunk in chunks]
+                for file_path, chunks in store.file_chunks().items()}
+    finally:
+        store.close()
+
+
+def test_incremental_build_only_chunks_changed_files(tmp_path, repo, chunked):
+    files = ["src/a.py", "src/b.py", "src/c.py"]
+    first = tmp_path / "v1"
+    assert _build(repo, files, first) == 3
+
+    (repo / "src" / "b.py").write_text("def b():\n    return 20\n")
+    second = tmp_path / "v2"
+    count = _build(repo, ["src/a.py", "src/b.py"], second, base_dir=str(first))
+
+    assert chunked == [files, ["src/b.py"]]
+    assert count == 2
+    assert set(_files(second)) == {"src/a.py", "src/b.py"}
+    index = faiss.read_index(str(second / FAISS_INDEX_NAME))
+    store = ChunkStore(str(second / CHUNK_STORE_NAME), read_only=True)
+    try:
+        ids = store.filter_ids()
+        # Every chunk row still has its own vector
+        assert index.reconstruct_batch(ids).shape == (2, index.d)
+        assert "return 20" in store.get_nodes(store.filter_ids(files=["src/b.py"]))[0].get_content()
+    finally:
+        store.close()
+
+
+def test_build_is_full_when_the_base_used_other_settings(tmp_path, repo, chunked, monkeypatch):
+    files = ["src/a.py", "src/b.py"]
+    first = tmp_path / "v1"
+    _build(repo, files, first)
+
+    monkeypatch.setattr(smartChunking, "model_versions", lambda: {"chunk_model": "another-model"})
+    _build(repo, files, tmp_path / "v2", base_dir=str(first))
+
+    assert chunked == [files, files]
+
+
+def test_missing_base_falls_back_to_a_full_build(tmp_path, repo, chunked):
+    files = ["src/a.py"]
+    assert _build(repo, files, tmp_path / "v2", base_dir=str(tmp_path / "gone")) == 1
+    assert chunked == [files]
+
+
+# ---------------------------------------------------------------- chunk deduplication
+
+
+def _chunk(file_path: str, number: int, text: str) -> Document:
+    return Document(text=text, doc_id=f"{file_path}#chunk-{number}", metadata={"file": file_path})
+
+
+def test_merge_keeps_chunks_whose_ids_collide():
+    # The model numbered two different chunks of the same file alike
+    documents = [_chunk("src/a.py", 1, "def a():\n    return 1\n"), _chunk("src/a.py", 1, "def b():\n    return 2\n")]
+    assert smartChunking._merge_duplicate_chunks(documents) == documents
+
+
+def test_merge_only_collapses_identical_chunks():
+    shared = "def helper(value):\n    total = value * 2\n    return total + compute_offset(value)\n"
+    near = shared.replace("* 2", "* 3")
+    documents = [_chunk("src/a.py", 1, shared), _chunk("src/b.py", 1, shared), _chunk("src/c.py", 1, near)]
+
+    merged = smartChunking._merge_duplicate_chunks(documents)
+
+    assert [document.metadata["file"] for document in merged] == ["src/a.py", "src/c.py"]
+    assert merged[0].metadata["duplicate_files"] == ["src/b.py"]
+    # A near-duplicate keeps its own text
+    assert merged[1].text == near and "duplicate_files" not in merged[1].metadata
+
+
+# ---------------------------------------------------------------- span responses
+
+SOURCE = "import os\n\ndef a():\n    return 1\n\ndef b():\n    return 2\n\nprint(a())\n"
+
+
+class FixedModel:
+    """A chunk model that answers every request with the same text."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def generate_content(self, *args, **kwargs):
+        return SimpleNamespace(text=self.text)
+
+
+@pytest.mark.parametrize("response", [
+    '```json\n[{"start_line": 1, "end_line": 2}]\n```',
+    '{"start_line": 1, "end_line": 2}',
+    '{"start_line": 1, "end_line": 2}\nnot json\n',
+], ids=["fenced-array", "single-object", "json-lines"])
+def test_chunk_responses_parse_to_a_list(response):
+    assert smartChunking._parse_chunk_response(response) == [{"start_line": 1, "end_line": 2}]
+
+
+def test_unparseable_chunk_response_raises():
+    with pytest.raises(json.JSONDecodeError):
+        smartChunking._parse_chunk_response("Sorry, I can't chunk this file.")
+
+
+def test_spans_slice_the_exact_lines():
+    chunks = smartChunking._resolve_spans(SOURCE, [
+        {"name": "b", "start_line": 6, "end_line": 7, "keywords": ["b"]},
+        {"name": "a", "start_line": 3, "end_line": 4},
+    ])
+    assert [(c["name"], c["start_line"], c["end_line"]) for c in chunks] == [
+        ("misc", 1, 2), ("a", 3, 4), ("b", 6, 7), ("misc", 8, 9)
+    ]
+    assert chunks[1]["text"] == "def a():\n    return 1\n"
+    assert chunks[2]["keywords"] == ["b"]
+    # Every non-blank line is covered exactly once
+    assert "".join(c["text"] for c in chunks) == SOURCE.replace("    return 1\n\n", "    return 1\n")
+
+
+def test_out_of_range_spans_are_clamped_or_skipped():
+    chunks = smartChunking._resolve_spans(SOURCE, [
+        {"name": "all", "start_line": -5, "end_line": 100},
+        {"name": "past-the-end", "start_line": 20, "end_line": 30},
+        {"name": "unnumbered", "start_line": "three", "end_line": 4},
+    ])
+    assert [(c["name"], c["start_line"], c["end_line"]) for c in chunks] == [("all", 1, 9)]
+    assert chunks[0]["text"] == SOURCE
+
+    with pytest.raises(ValueError):
+        smartChunking._resolve_spans(SOURCE, [{"start_line": 20, "end_line": 30}, "not a span"])
+
+
+def test_overlapping_spans_are_trimmed_or_dropped():
+    chunks = smartChunking._resolve_spans(SOURCE, [
+        {"name": "head", "start_line": 1, "end_line": 4},
+        # Mostly inside the first span
+        {"name": "inside", "start_line": 2, "end_line": 5},
+        # One line of overlap with the first span
+        {"name": "tail", "start_line": 4, "end_line": 9},
+    ])
+    assert [(c["name"], c["start_line"], c["end_line"]) for c in chunks] == [("head", 1, 4), ("tail", 5, 9)]
+
+
+def test_unusable_response_falls_back_to_simple_splitting(monkeypatch):
+    monkeypatch.setattr(smartChunking, "CHUNKING_MODE", "span")
+    parser = SimpleNodeParser.from_defaults(chunk_size=1024, chunk_overlap=20)
+
+    for response in ("not json at all", '[{"name": "nothing", "start_line": 40, "end_line": 50}]'):
+        documents = smartChunking._chunk_file("src/app.py", SOURCE, FixedModel(response), parser)
+        assert [document.doc_id for document in documents] == ["src/app.py#misc-1"]
+
+    documents = smartChunking._chunk_file(
+        "src/app.py", SOURCE, FixedModel('[{"name": "a", "start_line": 1, "end_line": 9}]'), parser
+    )
+    assert [(d.doc_id, d.metadata["start_line"], d.metadata["end_line"]) for d in documents] == [
+        ("src/app.py#chunk-1", 1, 9)
+    ]
+
+
+# ---------------------------------------------------------------- batched requests
+
+
+def test_oversize_files_get_a_request_of_their_own():
+    requests = smartChunking.pack_files({"big.py": 500, "huge.py": 5000, "small.py": 10},
+                                        budget=1000, max_file_tokens=400, max_files=10)
+    assert requests == [["huge.py"], ["big.py"], ["small.py"]]
+
+
+def test_files_pack_first_fit_decreasing_under_the_budget():
+    tokens = {"a.py": 60, "b.py": 50, "c.py": 40, "d.py": 30, "e.py": 20}
+    requests = smartChunking.pack_files(tokens, budget=100, max_file_tokens=100, max_files=10)
+    assert requests == [["a.py", "c.py"], ["b.py", "d.py", "e.py"]]
+    assert all(sum(tokens[f] for f in request) <= 100 for request in requests)
+
+    limited = smartChunking.pack_files(tokens, budget=1000, max_file_tokens=100, max_files=2)
+    assert limited == [["a.py", "b.py"], ["c.py", "d.py"], ["e.py"]]
+
+
+def test_batch_responses_split_by_file():
+    files = ["src/a.py", "src/b.py"]
+    keyed = json.dumps({"src/a.py": [{"start_line": 1, "end_line": 2}], "src/unknown.py": []})
+    assert smartChunking._split_batch_response(keyed, files) == {"src/a.py": [{"start_line": 1, "end_line": 2}]}
+
+    flat = json.dumps([{"file": "src/b.py", "start_line": 1, "end_line": 2},
+                       {"file": "src/elsewhere.py", "start_line": 1, "end_line": 2}])
+    assert smartChunking._split_batch_response(flat, files) == {
+        "src/b.py": [{"file": "src/b.py", "start_line": 1, "end_line": 2}]
+    }
+
+
+class BatchModel:
+    """Answers batch requests with `batch_response` and single files with one span."""
+
+    def __init__(self, batch_response: str):
+        self.batch_response = batch_response
+        self.requests = []
+
+    def generate_content(self, prompt, **kwargs):
+        batched = "=== File:" in prompt
+        self.requests.append("batch" if batched else prompt.split("File Path: ")[1].split("\n")[0])
+        text = self.batch_response if batched else '[{"name": "single", "start_line": 1, "end_line": 2}]'
+        return SimpleNamespace(text=text)
+
+
+def test_files_missing_from_a_batch_response_are_chunked_alone(monkeypatch):
+    monkeypatch.setattr(smartChunking, "CHUNKING_MODE", "span")
+    contents = {"src/a.py": "def a():\n    return 1\n", "src/b.py": "def b():\n    return 2\n"}
+    model = BatchModel(json.dumps({
+        "src/a.py": [{"name": "batched", "start_line": 1, "end_line": 2}],
+        "src/unknown.py": [{"name": "invented", "start_line": 1, "end_line": 2}],
+    }))
+    parser = SimpleNodeParser.from_defaults(chunk_size=1024, chunk_overlap=20)
+
+    documents = smartChunking._chunk_files(list(contents), contents, model, parser)
+
+    assert model.requests == ["batch", "src/b.py"]
+    assert {file_path: [d.metadata["name"] for d in docs] for file_path, docs in documents.items()} == {
+        "src/a.py": ["batched"], "src/b.py": ["single"]
+    }
@@ -0,0 +1,92 @@
+# test_tokenLedger.py
+
+import asyncio
+
+import pytest
+from llama_index.core.base.llms.types import CompletionResponse, LLMMetadata
+from llama_index.core.llms.custom import CustomLLM
+
+import providers
+from appConfig import CHUNK_MODEL_NAME
+from gatewayLLM import GatewayLLM
+from providers import ProviderRegistry
+from tokenLedger import estimate_ingest, read_ledger, usage_context
+
+
+class UsageLLM(CustomLLM):
+    """Answers every prompt, reporting usage the way the Gemini LLM does."""
+
+    usage: dict | None = None
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="usage-model")
+
+    def complete(self, prompt, formatted: bool = False, **kwargs):
+        raw = {"usage_metadata": self.usage} if self.usage else {}
+        return CompletionResponse(text="the answer", raw=raw)
+
+    def stream_complete(self, prompt, formatted: bool = False, **kwargs):
+        raise NotImplementedError
+
+
+def test_llm_calls_record_the_reported_usage(tmp_path):
+    ledger = str(tmp_path / "usage.jsonl")
+    reporting = GatewayLLM(UsageLLM(usage={"prompt_token_count": 42, "candidates_token_count": 7}),
+                           rate_limited=False)
+    silent = GatewayLLM(UsageLLM(), rate_limited=False)
+
+    async def synthesize():
+        return await reporting.acomplete("what does parse do?")
+
+    with usage_context(ledger=ledger, stage="chat"):
+        asyncio.run(synthesize())
+        silent.complete("what does parse do?")
+
+    reported, estimated = read_ledger(ledger)
+    assert (reported["prompt_tokens"], reported["completion_tokens"], reported["estimated"]) == (42, 7, False)
+    assert reported["model"] == "usage-model" and reported["stage"] == "chat"
+    assert estimated["estimated"] and estimated["prompt_tokens"] > 0 and estimated["completion_tokens"] > 0
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo_dir = tmp_path / "repo"
+    (repo_dir / "src").mkdir(parents=True)
+    (repo_dir / "src" / "app.py").write_text("def main():\n    return 1\n" * 40)
+    tree_file = tmp_path / "tree_structure.txt"
+    tree_file.write_text("repo\n  src\n    app.py (path: src/app.py)\n")
+    return str(tree_file), str(repo_dir)
+
+
+def _use_registry(monkeypatch, registry):
+    monkeypatch.setattr(providers, "_registry", registry)
+
+
+def test_estimate_does_not_need_an_api_key(repo, tmp_path, monkeypatch):
+    registry = ProviderRegistry("gemini", "gemini", "", stats_dir=str(tmp_path / "stats"))
+    _use_registry(monkeypatch, registry)
+    tree_file, repo_dir = repo
+
+    estimate = estimate_ingest(tree_file, repo_dir)
+
+    assert estimate["files"] == 1
+    assert estimate["stages"]["embedding"]["calls"] == 2
+    # No client was created for the estimate
+    assert registry._clients == {}
+
+
+def test_estimate_uses_chunking_latency_from_the_ingest_pool(repo, tmp_path, monkeypatch):
+    stats_dir = tmp_path / "stats"
+    web = ProviderRegistry("offline", "offline", "", stats_dir=str(stats_dir))
+    web._process_id = 1
+    worker = ProviderRegistry("offline", "offline", "", stats_dir=str(stats_dir))
+    worker._process_id = 2
+    worker._stats_for(f"offline:{CHUNK_MODEL_NAME}").record(30.0)
+    worker.publish_stats()
+    _use_registry(monkeypatch, web)
+    tree_file, repo_dir = repo
+
+    estimate = estimate_ingest(tree_file, repo_dir, include_stage_one=False)
+
+    assert estimate["stages"]["chunking"]["seconds"] == 30.0
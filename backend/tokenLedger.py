@@ -0,0 +1,306 @@
+# tokenLedger.py
+
+import contextvars
+import json
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from appConfig import (
+    BASE_DIR, CHUNKING_MODE, CHUNK_MODEL_NAME, STAGE_ONE_MODEL_NAME,
+    MODEL_REQUESTS_PER_MINUTE, MODEL_TOKENS_PER_MINUTE
+)
+from modelGateway import estimate_tokens
+
+# Per-call token records for an index version, written next to its files.
+TOKEN_LEDGER_NAME = "token_usage.jsonl"
+# Stage one runs before any index version exists, so its calls go to a
+# per-repo ledger that is copied into each version built from that repo.
+STAGE_ONE_LEDGER_FILE = os.path.join(BASE_DIR, "stage_one_usage.jsonl")
+
+# Rough shape of model output used by the dry-run estimator.
+DEFAULT_CALL_SECONDS = 2.0
+SECONDS_PER_COMPLETION_TOKEN = 0.01
+BYTES_PER_LINE = 40
+LINES_PER_CHUNK = 30
+TOKENS_PER_SPAN = 60
+TOKENS_PER_WORKSPACE = 150
+WORKSPACES_PER_REPO = 5
+SUMMARY_TOKENS_PER_FILE = 50
+
+_context = contextvars.ContextVar("token_ledger_context", default={})
+_write_lock = threading.Lock()
+_TREE_PATH_PATTERN = re.compile(r"\(path: (.+)\)$")
+
+
+@contextmanager
+def usage_context(**fields):
+    """
+    Attributes model calls made inside the block. Recognised fields are
+    `ledger` (file to append records to), `stage`, `repo` and `workspace`;
+    nested contexts override the fields they set.
+    """
+    token = _context.set({**_context.get(), **{k: v for k, v in fields.items() if v is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def record_usage(label: str, model: str | None, prompt_tokens: int, completion_tokens: int,
+                 estimated: bool, latency_seconds: float | None = None, stage: str | None = None):
+    """
+    Appends one model call to the ledger of the current usage context. Calls
+    made outside any context with a ledger are not recorded. `stage`
+    overrides the context's stage for this call.
+    """
+    context = _context.get()
+    path = context.get("ledger")
+    if not path:
+        return
+    entry = {
+        "ts": time.time(),
+        "stage": stage or context.get("stage", "unknown"),
+        "repo": context.get("repo"),
+        "workspace": context.get("workspace"),
+        "label": label,
+        "model": model,
+        "prompt_tokens": int(prompt_tokens),
+        "completion_tokens": int(completion_tokens),
+        "estimated": estimated,
+        "latency_ms": round(latency_seconds * 1000, 1) if latency_seconds is not None else None,
+    }
+    line = json.dumps(entry) + "\n"
+    try:
+        with _write_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError as e:
+        print(f"WARNING: Could not record token usage to {path}: {e}")
+
+
+def _reported_usage(response) -> tuple[int | None, int]:
+    """
+    The provider's prompt and completion token counts, from a
+    generate_content response or from the raw response a LlamaIndex LLM
+    keeps; (None, 0) if it reported none.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        raw = getattr(response, "raw", None)
+        usage = raw.get("usage_metadata") if isinstance(raw, dict) else getattr(raw, "usage_metadata", None)
+    if usage is None:
+        return None, 0
+    if isinstance(usage, dict):
+        return usage.get("prompt_token_count"), usage.get("candidates_token_count") or 0
+    return getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None) or 0
+
+
+def _response_text(response) -> str:
+    message = getattr(response, "message", None)
+    if message is not None:
+        return str(getattr(message, "content", "") or "")
+    try:
+        return response.text or ""
+    except (AttributeError, ValueError):
+        return ""
+
+
+def record_response(label: str, model: str | None, prompt: str, response, latency_seconds: float):
+    """
+    Records a generate_content call or a LlamaIndex LLM completion or chat
+    call, using the provider's reported usage when the response carries it
+    and estimating from text otherwise.
+    """
+    prompt_tokens, completion_tokens = _reported_usage(response)
+    if prompt_tokens is not None:
+        record_usage(label, model, prompt_tokens, completion_tokens, False, latency_seconds)
+        return
+    text = _response_text(response)
+    record_usage(label, model, estimate_tokens(prompt), estimate_tokens(text) if text else 0, True, latency_seconds)
+
+
+def read_ledger(path: str) -> list[dict]:
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A worker killed mid-write leaves a partial last line
+                continue
+    return entries
+
+
+def copy_ledger(source: str, target: str):
+    """Appends every record of `source` to `target`."""
+    entries = read_ledger(source)
+    if not entries:
+        return
+    with _write_lock, open(target, "a", encoding="utf-8") as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in entries)
+
+
+def _totals(entries: list[dict]) -> dict:
+    prompt = sum(e["prompt_tokens"] for e in entries)
+    completion = sum(e["completion_tokens"] for e in entries)
+    return {
+        "calls": len(entries),
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "total_tokens": prompt + completion,
+        "estimated_calls": sum(1 for e in entries if e.get("estimated")),
+        "model_seconds": round(sum(e.get("latency_ms") or 0 for e in entries) / 1000, 2),
+    }
+
+
+def summarize(entries: list[dict]) -> dict:
+    """Token totals overall and grouped by stage, repo and workspace."""
+    def grouped(key):
+        groups = {}
+        for entry in entries:
+            groups.setdefault(entry.get(key) or "unknown", []).append(entry)
+        return {name: _totals(group) for name, group in groups.items()}
+
+    return {
+        "total": _totals(entries),
+        "by_stage": grouped("stage"),
+        "by_repo": grouped("repo"),
+        "by_workspace": grouped("workspace"),
+    }
+
+
+def tree_file_paths(tree_text: str) -> list[str]:
+    """Repository-relative file paths listed in tree_structure.txt."""
+    paths = []
+    for line in tree_text.splitlines():
+        match = _TREE_PATH_PATTERN.search(line.rstrip())
+        if match:
+            paths.append(match.group(1))
+    return paths
+
+
+def _observed_call_seconds(model_name: str) -> float | None:
+    from providers import get_registry
+
+    # Chunking runs in the ingest pool, so read every process's stats
+    registry = get_registry()
+    stats = registry.shared_stats()["providers"].get(f"{registry.llm_provider}:{model_name}")
+    if stats and stats.get("calls") and "mean_ms" in stats:
+        return stats["mean_ms"] / 1000
+    return None
+
+
+def _stage_estimate(calls: int, prompt_tokens: int, completion_tokens: int,
+                    call_seconds: float, rate_limited: bool = True) -> dict:
+    # Calls run one after another, so the stage takes at least the sum of
+    # their latencies, and no less than the gateway's rate limits allow.
+    seconds = call_seconds
+    if rate_limited and calls:
+        seconds = max(
+            seconds,
+            calls * 60 / MODEL_REQUESTS_PER_MINUTE,
+            (prompt_tokens + completion_tokens) * 60 / MODEL_TOKENS_PER_MINUTE,
+        )
+    return {
+        "calls": calls,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "seconds": round(seconds, 1),
+    }
+
+
+def estimate_ingest(tree_file: str, repo_dir: str | None, file_paths: list[str] | None = None,
+                    include_stage_one: bool = True) -> dict:
+    """
+    Predicts the tokens and wall-clock time of an ingest without calling any
+    model. Stage one is sized from tree_structure.txt; chunking and
+    embedding from the byte size of each workspace file (every file in the
+    tree when `file_paths` is None).
+    """
+    from gemini import STAGE1_PROMPT
+    from providers import get_registry
+    from smartChunking import (
+        BATCH_CHUNKING_INSTRUCTIONS, SMART_CHUNKING_PROMPT, SPAN_CHUNKING_PROMPT, pack_files
+    )
+
+    with open(tree_file, "r", encoding="utf-8") as f:
+        tree_text = f.read()
+    if file_paths is None:
+        file_paths = tree_file_paths(tree_text)
+
+    stages = {}
+    if include_stage_one:
+        prompt = estimate_tokens(STAGE1_PROMPT) + estimate_tokens(tree_text)
+        completion = estimate_tokens("\n".join(tree_file_paths(tree_text))) + TOKENS_PER_WORKSPACE * WORKSPACES_PER_REPO
+        call_seconds = _observed_call_seconds(STAGE_ONE_MODEL_NAME) or (
+            DEFAULT_CALL_SECONDS + completion * SECONDS_PER_COMPLETION_TOKEN
+        )
+        stages["stage_one"] = _stage_estimate(1, prompt, completion, call_seconds)
+
+    template = SPAN_CHUNKING_PROMPT if CHUNKING_MODE == "span" else SMART_CHUNKING_PROMPT
+    template_tokens = estimate_tokens(template)
+    batch_tokens = estimate_tokens(BATCH_CHUNKING_INSTRUCTIONS)
+    observed = _observed_call_seconds(CHUNK_MODEL_NAME)
+    file_prompt = {}
+    file_completion = {}
+    file_tokens = {}
+    content_tokens = chunk_count = 0
+    missing = []
+    for file_path in file_paths:
+        full_path = os.path.join(repo_dir, file_path) if repo_dir else None
+        if not full_path or not os.path.isfile(full_path):
+            missing.append(file_path)
+            continue
+        size = os.path.getsize(full_path)
+        tokens = size // 4 + 1
+        chunks = max(1, math.ceil(size / BYTES_PER_LINE / LINES_PER_CHUNK))
+        # Span mode numbers every line and gets back short line ranges; code
+        # mode gets the whole file echoed back as chunk snippets.
+        file_prompt[file_path] = tokens + (size // BYTES_PER_LINE * 2 if CHUNKING_MODE == "span" else 0)
+        file_completion[file_path] = chunks * TOKENS_PER_SPAN + (tokens if CHUNKING_MODE != "span" else 0)
+        file_tokens[file_path] = tokens
+        content_tokens += tokens
+        chunk_count += chunks
+
+    # Small files share requests, so the prompt template is paid per request
+    requests = pack_files(file_tokens)
+    prompt = completion = 0
+    call_seconds = 0.0
+    for request in requests:
+        request_completion = sum(file_completion[f] for f in request)
+        prompt += template_tokens + (batch_tokens if len(request) > 1 else 0) + sum(file_prompt[f] for f in request)
+        completion += request_completion
+        call_seconds += observed or (DEFAULT_CALL_SECONDS + request_completion * SECONDS_PER_COMPLETION_TOKEN)
+    chunked_files = len(file_tokens)
+    stages["chunking"] = _stage_estimate(len(requests), prompt, completion, call_seconds)
+
+    registry = get_registry()
+    remote_embeddings = registry.embed_provider == "gemini"
+    # Read from configuration: a dry run must not build a model client
+    batch_size = registry.embed_batch_size()
+    embed_tokens = content_tokens + chunked_files * SUMMARY_TOKENS_PER_FILE
+    embed_calls = math.ceil(chunk_count / batch_size) + math.ceil(chunked_files / batch_size)
+    stages["embedding"] = _stage_estimate(
+        embed_calls, embed_tokens, 0, embed_calls * (0.5 if remote_embeddings else 0.05),
+        rate_limited=remote_embeddings
+    )
+
+    return {
+        "files": chunked_files,
+        "missing_files": missing,
+        "chunking_mode": CHUNKING_MODE,
+        "stages": stages,
+        "total": {
+            "calls": sum(s["calls"] for s in stages.values()),
+            "prompt_tokens": sum(s["prompt_tokens"] for s in stages.values()),
+            "completion_tokens": sum(s["completion_tokens"] for s in stages.values()),
+            "total_tokens": sum(s["total_tokens"] for s in stages.values()),
+            "seconds": round(sum(s["seconds"] for s in stages.values()), 1),
+        },
+    }